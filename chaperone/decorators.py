@@ -15,7 +15,11 @@
 #
 # From http://stackoverflow.com/questions/10031001/login-required-decorator-on-ajax-views-to-return-401-instead-of-302.
 #
+from functools import wraps
+
 from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
 
 
 def login_required_ajax(function=None):
@@ -37,3 +41,23 @@ def login_required_ajax(function=None):
         return _decorator
     else:
         return _decorator(function)
+
+
+def revalidate(etag_func):
+    """
+    Answer GET requests with 304 - not modified - when the client already has
+    the response, going by the ETag that etag_func returns for the request.
+
+    Browsers are told to check back every time before reusing a response they
+    have stored, so they send the ETag with their requests.
+    """
+    def _decorator(view_func):
+        conditional_view = condition(etag_func=etag_func)(view_func)
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        return _wrapped_view
+    return _decorator
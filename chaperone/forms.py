@@ -13,15 +13,13 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
-import fcntl
 import logging
 import os
-import yaml
 
 from django import forms
 from django.conf import settings
 
-from chaperone.utils import getters
+from chaperone.utils import getters, tasks, yaml
 
 LOG = logging.getLogger(__name__)
 
@@ -59,7 +57,7 @@ def _initialize_values(form_fields, vcenter_data, vcenter_field,
         # Pass in blank datacenter to get all options.
         try:
             datacenters = fn(vcenter=vcenter, username=username, password=password,
-                             datacenter='')
+                             datacenter='', caller='_initialize_values')
         except Exception, msg:
             LOG.warn("Exception caught: %s" % msg)
             datacenters = None
@@ -77,7 +75,8 @@ def _initialize_values(form_fields, vcenter_data, vcenter_field,
             fn = getattr(getters, fn_name)
             # Pass in blank cluster to get all options.
             clusters = fn(vcenter=vcenter, username=username,
-                          password=password, datacenter=datacenter, cluster='')
+                          password=password, datacenter=datacenter, cluster='',
+                          caller='_initialize_values')
             cluster_choices = [('', '-- select --')]
             if clusters is not None:
                 opt_names = clusters.keys()
@@ -131,15 +130,19 @@ class VCenterForm(forms.Form):
         if not os.path.exists(filename):
             return
 
-        with open(filename, 'r') as fp:
-            fcntl.flock(fp, fcntl.LOCK_SH)
-            file_contents = fp.read()
-            fcntl.flock(fp, fcntl.LOCK_UN)
-        vcenter_data = yaml.load(file_contents)
-
-        _initialize_values(self.fields, vcenter_data, getters.COMP_VC,
-                           getters.COMP_VC_USERNAME, getters.COMP_VC_PASSWORD,
-                           getters.COMP_VC_DATACENTER, getters.COMP_VC_CLUSTER)
-        _initialize_values(self.fields, vcenter_data, getters.MGMT_VC,
-                           getters.MGMT_VC_USERNAME, getters.MGMT_VC_PASSWORD,
-                           getters.MGMT_VC_DATACENTER, getters.MGMT_VC_CLUSTER)
+        vcenter_data = yaml.load(filename)
+
+        # Look up both vCenters at the same time.
+        results = tasks.run_all([
+            (_initialize_values,
+             (self.fields, vcenter_data, getters.COMP_VC,
+              getters.COMP_VC_USERNAME, getters.COMP_VC_PASSWORD,
+              getters.COMP_VC_DATACENTER, getters.COMP_VC_CLUSTER), {}),
+            (_initialize_values,
+             (self.fields, vcenter_data, getters.MGMT_VC,
+              getters.MGMT_VC_USERNAME, getters.MGMT_VC_PASSWORD,
+              getters.MGMT_VC_DATACENTER, getters.MGMT_VC_CLUSTER), {}),
+        ])
+        for result, error in results:
+            if error:
+                LOG.warn('Unable to get vCenter choices: %s' % error)
@@ -0,0 +1,84 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chaperone.utils import yaml
+
+
+class Command(BaseCommand):
+    args = '[file ...]'
+    help = ('Times parsing and writing YAML files with the pure Python and '
+            'the libyaml loaders and dumpers. Defaults to the answer file '
+            'schema and answer file.')
+    option_list = BaseCommand.option_list + (
+        make_option('--repeat', type='int', default=20,
+                    help='Number of times to parse and write each file.'),
+    )
+
+    def _time(self, fn, arg, repeat):
+        # Return the best time in seconds of calling the function.
+        best = None
+        for i in range(repeat):
+            start = time.time()
+            fn(arg)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+        return best
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        if repeat < 1:
+            raise CommandError('Repeat must be at least 1.')
+        if not yaml.HAS_LIBYAML:
+            raise CommandError('PyYAML was built without libyaml.')
+
+        filenames = args or [
+            os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE),
+            os.path.join(settings.ANSWER_FILE_DIR,
+                         settings.ANSWER_FILE_DEFAULT),
+        ]
+        for filename in filenames:
+            try:
+                with open(filename) as fp:
+                    text = fp.read()
+            except IOError, e:
+                raise CommandError('Unable to read %s: %s' % (filename, e))
+
+            # Included files come from the load cache, so mostly this file's
+            # own text is timed.
+            pure = self._time(lambda t: yaml.loads(t, yaml.PURE_LOADER),
+                              text, repeat)
+            fast = self._time(lambda t: yaml.loads(t, yaml.LOADER),
+                              text, repeat)
+            content = yaml.loads(text, yaml.LOADER)
+            pure_dump = self._time(lambda c: yaml.dumps(c, yaml.PURE_DUMPER),
+                                   content, repeat)
+            fast_dump = self._time(lambda c: yaml.dumps(c, yaml.DUMPER),
+                                   content, repeat)
+
+            self.stdout.write('%s (%d bytes)' % (filename, len(text)))
+            self.stdout.write('  load: python %.2f ms, libyaml %.2f ms '
+                              '(%.1fx)' % (pure * 1000, fast * 1000,
+                                           pure / max(fast, 1e-9)))
+            self.stdout.write('  dump: python %.2f ms, libyaml %.2f ms '
+                              '(%.1fx)' % (pure_dump * 1000, fast_dump * 1000,
+                                           pure_dump / max(fast_dump, 1e-9)))
@@ -0,0 +1,55 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import os
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chaperone.utils import schema, yaml
+
+
+class Command(BaseCommand):
+    help = ('Checks the answer file schema, with its includes, and compiles '
+            'it so that workers load it without parsing YAML.')
+    option_list = BaseCommand.option_list + (
+        make_option('--check', action='store_true', default=False,
+                    help='Only check the schema.'),
+    )
+
+    def handle(self, *args, **options):
+        base = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
+        if not os.path.exists(base):
+            raise CommandError('No schema %s.' % base)
+
+        errors = schema.validate(yaml.load(base))
+        if errors:
+            raise CommandError('Schema %s is not valid:\n%s' % (
+                base, '\n'.join(errors)))
+        if options['check']:
+            self.stdout.write('Schema %s is valid.' % base)
+            return
+
+        try:
+            content = yaml.compile_file(base)
+        except (IOError, OSError, ValueError), e:
+            raise CommandError('Unable to compile %s: %s' % (base, e))
+        if content is None:
+            self.stdout.write('Schema %s has values, like dates, that cannot '
+                              'be compiled, so is parsed as before.' % base)
+            return
+        self.stdout.write('Compiled %s to %s%s.' % (base, base,
+                                                    yaml.COMPILED_SUFFIX))
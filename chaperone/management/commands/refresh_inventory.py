@@ -0,0 +1,78 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import logging
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from chaperone.utils import inventory, yaml
+
+LOG = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = ('Rebuilds the vCenter field options in INPUT_OPTIONS from the '
+            'saved vCenter settings, once or periodically.')
+    option_list = BaseCommand.option_list + (
+        make_option('--interval', type='int', default=0,
+                    help='Keep running, rebuilding the options every '
+                         'INTERVAL seconds.'),
+    )
+
+    def _refresh(self):
+        # Return True if the options were rebuilt.
+        vcenter_data = yaml.load(settings.VCENTER_SETTINGS)
+        if not vcenter_data:
+            LOG.info('No vCenter settings saved in %s' %
+                     settings.VCENTER_SETTINGS)
+            return False
+
+        start = time.time()
+        options_data, errors = inventory.get_options(vcenter_data)
+        if errors:
+            # Keep the last good options.
+            LOG.error('Unable to refresh vCenter options: %s' % errors)
+            self.stderr.write('\n'.join(errors))
+            return False
+
+        if inventory.save_options(options_data):
+            self.stdout.write('Refreshed %s in %.1f seconds.' %
+                              (settings.INPUT_OPTIONS, time.time() - start))
+        else:
+            self.stdout.write('%s unchanged, checked in %.1f seconds.' %
+                              (settings.INPUT_OPTIONS, time.time() - start))
+        return True
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        if interval < 0:
+            raise CommandError('Interval must not be negative.')
+
+        while True:
+            try:
+                refreshed = self._refresh()
+            except Exception:
+                if not interval:
+                    raise
+                LOG.exception('Unable to refresh vCenter options')
+                refreshed = False
+            if not interval:
+                if not refreshed:
+                    raise CommandError('vCenter options not refreshed.')
+                return
+            time.sleep(interval)
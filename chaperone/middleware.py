@@ -0,0 +1,52 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import time
+
+from chaperone.utils import metrics
+
+
+class MetricsMiddleware(object):
+    """
+    Count requests by view, method and status code, and time each view.
+
+    Goes first in MIDDLEWARE_CLASSES, so the time includes other middleware.
+    Streamed responses, such as log streams, are timed up to when they start.
+    """
+
+    def process_request(self, request):
+        request._metrics_start = time.time()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = getattr(request, 'resolver_match', None)
+        if match and match.url_name:
+            request._metrics_view = ':'.join(match.namespaces +
+                                             [match.url_name])
+        else:
+            request._metrics_view = '%s.%s' % (view_func.__module__,
+                                               view_func.__name__)
+
+    def process_response(self, request, response):
+        start = getattr(request, '_metrics_start', None)
+        if start is None:
+            return response
+        # Requests that match no URL have no view.
+        view = getattr(request, '_metrics_view', '')
+        metrics.observe('chaperone_http_request_duration_seconds',
+                        time.time() - start, view=view)
+        metrics.inc('chaperone_http_requests_total', view=view,
+                    method=request.method, status=response.status_code)
+        metrics.flush()
+        return response
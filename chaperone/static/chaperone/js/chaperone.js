@@ -219,6 +219,8 @@ chaperone.utils = {
   },
 
   openLeftnavItem: function(itemId) {
+    /* Stop following the log of the group being left. */
+    chaperone.utils.unwatchLog();
     /* Note which item was last viewed. */
     chaperone.utils.clearMessages();
     var $div = $('#' + itemId);
@@ -255,6 +257,8 @@ chaperone.utils = {
         data: { mname: menuName, gname: groupName },
         success: function(response) {
           $('#contents-' + itemId).html(response);
+          /* Keep log viewer up to date. */
+          chaperone.utils.watchLog(itemId, menuName, groupName);
         },
         error: function(jqxhr, status, error) {
           chaperone.utils.ajaxError(jqxhr, status, error);
@@ -264,11 +268,6 @@ chaperone.utils = {
           $('#loading').hide();
         }
       });
-
-      /* Update log viewer periodically. */
-      setTimeout(function() {
-        chaperone.utils.updateLogView(itemId, menuName, groupName);
-      }, 2000);
     }
   },
 
@@ -330,15 +329,37 @@ chaperone.utils = {
     });
   },
 
+  showLogOutput: function(itemId, data) {
+    /* Show recent output and scroll to the bottom. */
+    var $output = $('#execute-output-' + itemId);
+    if (!$output.length) {
+      return;
+    }
+    if (data.reset) {
+      $output.text(data.output);
+    } else if (data.output) {
+      $output.append(document.createTextNode(data.output));
+    }
+    if (data.reset || data.output) {
+      $output.scrollTop($output[0].scrollHeight);
+    }
+    $output.attr('data-run', data.run).attr('data-offset', data.offset);
+  },
+
   updateLogView: function(itemId, menuName, groupName) {
+    /* Only ask for output written since the last update. */
+    var $output = $('#execute-output-' + itemId);
     $.ajax({
       url: '/execute/tail',
-      data: { mname: menuName, gname: groupName },
-      success: function(response) {
-        /* Show recent output and scroll to the bottom. */
-        var $output = $('#execute-output-' + itemId);
-        if (response && $output.length && response != $output.text()) {
-          $output.text(response).scrollTop($output[0].scrollHeight);
+      data: { mname: menuName, gname: groupName,
+              run: $output.attr('data-run') || '',
+              offset: $output.attr('data-offset') || 0 },
+      /* Send the ETag of the last response, so nothing is sent back if
+       * there is no new output. */
+      ifModified: true,
+      success: function(data, status) {
+        if (status != 'notmodified') {
+          chaperone.utils.showLogOutput(itemId, data);
         }
 
         /* Schedule another update, if we're still on the page. */
@@ -353,6 +374,58 @@ chaperone.utils = {
       }
     });
   },
+
+  logSource: null,
+
+  unwatchLog: function() {
+    if (chaperone.utils.logSource) {
+      chaperone.utils.logSource.close();
+      chaperone.utils.logSource = null;
+    }
+  },
+
+  watchLog: function(itemId, menuName, groupName) {
+    /* Have output pushed as it is written to the log, if the browser
+     * supports it. Otherwise poll for it. */
+    chaperone.utils.unwatchLog();
+    if (!window.EventSource) {
+      setTimeout(function() {
+        chaperone.utils.updateLogView(itemId, menuName, groupName);
+      }, 2000);
+      return;
+    }
+
+    var $output = $('#execute-output-' + itemId);
+    var source = new EventSource('/execute/stream?' + $.param({
+      mname: menuName, gname: groupName,
+      run: $output.attr('data-run') || '',
+      offset: $output.attr('data-offset') || 0
+    }));
+    source.addEventListener('log', function(event) {
+      if (!$('#contents-' + itemId).length) {
+        /* No longer on the page. */
+        source.close();
+        return;
+      }
+      chaperone.utils.showLogOutput(itemId, JSON.parse(event.data));
+    });
+    source.addEventListener('end', function(event) {
+      /* The run is done, so don't let the browser connect again. */
+      source.close();
+      if (chaperone.utils.logSource === source) {
+        chaperone.utils.logSource = null;
+      }
+    });
+    source.addEventListener('error', function(event) {
+      /* Turned away, as too many streams are open, so poll instead. */
+      if (source.readyState == EventSource.CLOSED &&
+          chaperone.utils.logSource === source) {
+        chaperone.utils.logSource = null;
+        chaperone.utils.updateLogView(itemId, menuName, groupName);
+      }
+    });
+    chaperone.utils.logSource = source;
+  },
 };
 
 chaperone.addInitFunction(function() {
@@ -613,10 +686,27 @@ chaperone.addInitFunction(function() {
     var message = 'Starting ' + $button.text().toLowerCase() + '...\n';
     var mgid = $button.attr('data-mgid');
     $('#execute-output-' + mgid).text(message);
+    var menuName = $('#execute-form input[name="mname"]').val();
+    var groupName = $('#execute-form input[name="gname"]').val();
+    var restartStream = function() {
+      /* Follow the new run right away, as any earlier stream has ended.
+       * Polling picks it up on its own. */
+      if (window.EventSource) {
+        chaperone.utils.watchLog(mgid, menuName, groupName);
+      }
+    };
+    restartStream();
     $.ajax({
       url: '/execute/run',
       type: 'POST',
       data: values,
+      success: function(data) {
+        if (data.errors && data.errors.length) {
+          $('#error-message').html(data.errors.join('<br/>'));
+          return;
+        }
+        restartStream();
+      },
       error: function(jqxhr, status, error) {
         chaperone.utils.ajaxError(jqxhr, status, error);
       },
@@ -629,6 +719,36 @@ chaperone.addInitFunction(function() {
     return false;
   });
 
+  /* Stop the group's running commands. */
+  $(document).on('click', '#execute-form button.execute-cancel-btn',
+                 function(event) {
+    var values = chaperone.utils.getFormValues($('#execute-form')[0]);
+    if (!values) {
+        return false;
+    }
+    var mgid = $(this).attr('data-mgid');
+    $.ajax({
+      url: '/execute/cancel',
+      type: 'POST',
+      data: values,
+      success: function(data) {
+        if (data.errors && data.errors.length) {
+          $('#error-message').html(data.errors.join('<br/>'));
+          return;
+        }
+        $('#execute-output-' + mgid).append(
+          document.createTextNode('Cancelling...\n'));
+      },
+      error: function(jqxhr, status, error) {
+        chaperone.utils.ajaxError(jqxhr, status, error);
+      },
+      /* Need these for sending FormData. */
+      processData: false,
+      contentType: false
+    });
+    return false;
+  });
+
   /* Change active leftnav button. */
   $('#leftnav div.leftnav-btn').click(function(event) {
     chaperone.utils.openLeftnavMenu(this.id);
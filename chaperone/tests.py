@@ -0,0 +1,323 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import imp
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from django.utils.safestring import mark_safe
+
+from chaperone import views
+from chaperone.utils import getters, yaml
+
+
+class YamlTestCase(TestCase):
+    """Loads and dumps YAML files in a directory of their own."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _write(self, name, text):
+        # Write the file, and return its path.
+        path = os.path.join(self.dir, name)
+        with open(path, 'w') as fp:
+            fp.write(text)
+        return path
+
+
+class LegacyFormatTest(YamlTestCase):
+
+    # As written by the default yaml.Dumper, before only safe types were.
+    OLD_FORMAT = '\n'.join([
+        "ascii: !!python/unicode 'abc'",
+        "count: !!python/long '3'",
+        "name: \"caf\\xE9\"",
+        "pair: !!python/tuple",
+        "- 1",
+        "- b",
+        "safe: !!python/object/new:django.utils.safestring.SafeText",
+        "- !!python/unicode 'x'",
+        "",
+    ])
+
+    def test_load_old_format(self):
+        for loader in (yaml.PURE_LOADER, yaml.LOADER):
+            content = yaml.loads(self.OLD_FORMAT, loader)
+            self.assertEqual(content, {
+                'ascii': u'abc',
+                'count': 3,
+                'name': u'caf\xe9',
+                'pair': (1, 'b'),
+                'safe': u'x',
+            })
+            self.assertEqual(type(content['safe']), unicode)
+
+    def test_load_old_file(self):
+        path = self._write('answers.yml', self.OLD_FORMAT)
+        self.assertEqual(yaml.load(path)['pair'], (1, 'b'))
+
+    def test_other_objects_not_loaded(self):
+        self.assertRaises(yaml.yaml.YAMLError, yaml.loads,
+                          "a: !!python/object/new:os.system ['true']\n")
+
+    def test_dump_string_subclasses(self):
+        path = os.path.join(self.dir, 'answers.yml')
+        yaml.dump(path, {'a': mark_safe(u'caf\xe9'), 'b': mark_safe('b')})
+        with open(path) as fp:
+            self.assertNotIn('!!', fp.read())
+        self.assertEqual(yaml.load(path), {'a': u'caf\xe9', 'b': 'b'})
+
+
+class CacheTest(YamlTestCase):
+
+    def setUp(self):
+        super(CacheTest, self).setUp()
+        self.parsed = []
+        self._parse = yaml._parse
+
+        def parse(fname):
+            self.parsed.append(fname)
+            return self._parse(fname)
+
+        yaml._parse = parse
+        self.included = self._write('included.yml', 'b: [1, 2]\n')
+        self.base = self._write('base.yml',
+                                'a: !include %s\n' % self.included)
+
+    def tearDown(self):
+        yaml._parse = self._parse
+        for path in (self.base, self.included):
+            yaml._cache.pop(path, None)
+        super(CacheTest, self).tearDown()
+
+    def test_parsed_once(self):
+        self.assertEqual(yaml.load(self.base), {'a': {'b': [1, 2]}})
+        self.assertEqual(yaml.load(self.base), {'a': {'b': [1, 2]}})
+        self.assertEqual(self.parsed, [self.base, self.included])
+
+    def test_included_file_changed(self):
+        version = yaml.version(self.base)
+        yaml.load(self.base)
+        self._write('included.yml', 'b: [1, 2, 3]\n')
+        self.assertEqual(yaml.load(self.base), {'a': {'b': [1, 2, 3]}})
+        self.assertEqual(self.parsed, [self.base, self.included] * 2)
+        self.assertNotEqual(yaml.version(self.base), version)
+
+    def test_file_created(self):
+        missing = os.path.join(self.dir, 'missing.yml')
+        self.assertEqual(yaml.load(missing), {})
+        self._write('missing.yml', 'c: 3\n')
+        self.assertEqual(yaml.load(missing), {'c': 3})
+        yaml._cache.pop(missing, None)
+
+    def test_copy_returned(self):
+        content = yaml.load(self.base)
+        content['a']['b'].append(3)
+        content['d'] = 4
+        self.assertEqual(yaml.load(self.base), {'a': {'b': [1, 2]}})
+        self.assertEqual(yaml.load(self.included), {'b': [1, 2]})
+
+    def test_dump_forgets_content(self):
+        yaml.load(self.base)
+        yaml.dump(self.base, {'e': 5})
+        self.assertEqual(yaml.load(self.base), {'e': 5})
+
+
+class CompiledContentTest(YamlTestCase):
+
+    def setUp(self):
+        super(CompiledContentTest, self).setUp()
+        self.calls = []
+        self._parse = yaml._parse
+        self._hash_file = yaml._hash_file
+
+        def parse(fname):
+            self.calls.append(('parse', fname))
+            return self._parse(fname)
+
+        def hash_file(fname):
+            self.calls.append(('hash', fname))
+            return self._hash_file(fname)
+
+        yaml._parse = parse
+        yaml._hash_file = hash_file
+        self.included = self._write('included.yml', 'b: 1\n')
+        self.base = self._write('base.yml',
+                                'a: !include %s\n' % self.included)
+
+    def tearDown(self):
+        yaml._parse = self._parse
+        yaml._hash_file = self._hash_file
+        for path in (self.base, self.included):
+            yaml._cache.pop(path, None)
+        super(CompiledContentTest, self).tearDown()
+
+    def _compile(self):
+        yaml.compile_file(self.base)
+        yaml._cache.clear()
+        del self.calls[:]
+
+    def test_compiled_content_used(self):
+        self._compile()
+        self.assertEqual(yaml.load(self.base), {'a': {'b': 1}})
+        # Neither parsed, nor hashed, as nothing changed.
+        self.assertEqual(self.calls, [])
+
+    def test_included_file_changed(self):
+        self._compile()
+        self._write('included.yml', 'b: 22\n')
+        self.assertEqual(yaml.load(self.base), {'a': {'b': 22}})
+        self.assertIn(('parse', self.base), self.calls)
+
+    def test_touched_file_hashed(self):
+        self._compile()
+        os.utime(self.included, (0, 0))
+        self.assertEqual(yaml.load(self.base), {'a': {'b': 1}})
+        self.assertEqual(self.calls, [('hash', self.included)])
+
+    def test_uncompilable_content(self):
+        self._compile()
+        compiled = self.base + yaml.COMPILED_SUFFIX
+        self.assertTrue(os.path.exists(compiled))
+        self._write('included.yml', 'b: 2015-01-02\n')
+        self.assertEqual(yaml.compile_file(self.base), None)
+        self.assertFalse(os.path.exists(compiled))
+        yaml._cache.clear()
+        self.assertEqual(yaml.load(self.base)['a']['b'].year, 2015)
+
+
+class FileWrapperTest(TestCase):
+    """Files of responses handed to the WSGI server to send."""
+
+    def setUp(self):
+        self.wsgi = imp.load_source(
+            'chaperone_wsgi',
+            os.path.join(os.path.dirname(__file__), 'wsgi', 'wsgi.py'))
+        self.closed = []
+        self.fp = tempfile.TemporaryFile()
+        self.fp.write('content')
+        self.fp.seek(0)
+
+    def tearDown(self):
+        self.fp.close()
+
+    def _application(self, file_to_stream):
+        # Return a Django application returning a response for the file.
+        test = self
+
+        class Response(object):
+            def close(self):
+                test.closed.append(self)
+
+        def application(environ, start_response):
+            response = Response()
+            response.file_to_stream = file_to_stream
+            return response
+
+        return application
+
+    def test_file_wrapper(self):
+        self.wsgi.django_application = self._application(self.fp)
+        wrapped = []
+
+        def file_wrapper(fp, block_size):
+            wrapped.append((fp, block_size))
+            return fp
+
+        result = self.wsgi.application({'wsgi.file_wrapper': file_wrapper},
+                                       None)
+        self.assertEqual(wrapped, [(result, self.wsgi.FILE_BLOCK_SIZE)])
+        self.assertEqual(result.fileno(), self.fp.fileno())
+        self.assertEqual(result.read(), 'content')
+        self.assertEqual(self.closed, [])
+        result.close()
+        self.assertEqual(len(self.closed), 1)
+
+    def test_no_file_wrapper(self):
+        self.wsgi.django_application = self._application(self.fp)
+        result = self.wsgi.application({}, None)
+        self.assertTrue(result.file_to_stream is self.fp)
+
+    def test_no_file(self):
+        self.wsgi.django_application = self._application(None)
+        result = self.wsgi.application({'wsgi.file_wrapper': None}, None)
+        self.assertTrue(result.file_to_stream is None)
+
+
+class MetricsTest(TestCase):
+    """Access to /metrics."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def _get(self, **headers):
+        return views.export_metrics(self.factory.get('/metrics', **headers))
+
+    def test_no_token_set(self):
+        with override_settings(CHAPERONE_METRICS_TOKEN=None):
+            # Not even from this host.
+            response = self._get(REMOTE_ADDR='127.0.0.1',
+                                 HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, 403)
+
+    def test_token(self):
+        with override_settings(CHAPERONE_METRICS_TOKEN='secret'):
+            self.assertEqual(self._get().status_code, 403)
+            response = self._get(HTTP_AUTHORIZATION='Bearer other')
+            self.assertEqual(response.status_code, 403)
+            response = self._get(HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+    def test_allowed_ips(self):
+        with override_settings(CHAPERONE_METRICS_TOKEN='secret',
+                               CHAPERONE_METRICS_ALLOWED_IPS=('10.0.0.1',)):
+            response = self._get(REMOTE_ADDR='127.0.0.1',
+                                 HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 403)
+            response = self._get(REMOTE_ADDR='10.0.0.1',
+                                 HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class HostGettersTest(TestCase):
+    """Getters of hosts and what they reference, for a cluster."""
+
+    def setUp(self):
+        self.saved = getters._get_host_properties
+
+    def tearDown(self):
+        getters._get_host_properties = self.saved
+
+    def _hosts(self, hosts):
+        getters._get_host_properties = (
+            lambda *args, **kwargs: (None, {}, hosts))
+
+    def test_no_connection(self):
+        self._hosts(None)
+        self.assertEqual(getters.get_comp_vc_hosts(caller='test'), None)
+        self.assertEqual(getters.get_comp_vc_datastores(caller='test'), None)
+
+    def test_empty_cluster(self):
+        # No hosts is not the same as not being able to look them up.
+        self._hosts({})
+        self.assertEqual(getters.get_comp_vc_hosts(caller='test'), {})
+        self.assertEqual(getters.get_comp_vc_datastores(caller='test'), {})
@@ -31,6 +31,7 @@ urlpatterns = patterns('',
     url(r'^options$', login_required(views.list_options), name='options'),
     url(r'^savevc$', login_required_ajax(views.save_vcenter), name='savevc'),
     url(r'^vcenter$', login_required(views.vcenter_settings), name='vcenter'),
+    url(r'^metrics$', views.export_metrics, name='metrics'),
     url(r'^prepare/', include('prepare.urls', namespace='prepare')),
     url(r'^execute/', include('execute.urls', namespace='execute')),
 )
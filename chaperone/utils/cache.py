@@ -0,0 +1,68 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+import collections
+import threading
+import time
+
+
+class TTLCache(object):
+    """In-memory cache that drops entries once they are older than ttl
+    seconds, and drops the least recently used entries to hold no more than
+    max_size of them.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        # key: (value, time stored), least recently used first.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, newer_than=None):
+        """Returns (value, age in seconds) for the key, or None if there is no
+        entry for it, or it has expired or is not newer than the given time.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, stored = entry
+            if now - stored > self.ttl:
+                return None
+            if newer_than is not None and stored <= newer_than:
+                return None
+            self._entries[key] = entry
+        return value, now - stored
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time())
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, match=None):
+        """Drops all entries, or only those whose keys the given function
+        returns True for.
+        """
+        with self._lock:
+            if match is None:
+                self._entries.clear()
+                return
+            for key in self._entries.keys():
+                if match(key):
+                    del self._entries[key]
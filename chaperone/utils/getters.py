@@ -15,21 +15,25 @@
 #
 #
 # get_foos() returns a dict of the foo objects keyed by name. Used to populate
-# options for fields with attribute "options: foos".
+# options for fields with attribute "options: foos". Callers pass in their own
+# name as caller, for debug logging.
 
-import fcntl
-import inspect
+import atexit
+import hashlib
 import logging
 import os
 import sys
-import yaml
+import threading
+import time
 from requests import exceptions as requests_exceptions
 
 from django.conf import settings
 
-from pyVmomi import vim
+from pyVmomi import vim, vmodl
 from pyVim import connect
 
+from chaperone.utils import metrics, yaml
+
 
 LOG = logging.getLogger(__name__)
 
@@ -51,26 +55,137 @@ MGMT_VC_PASSWORD = 'mgmt_vc_password'
 MGMT_VC_USERNAME = 'mgmt_vc_username'
 MGMT_VC = 'mgmt_vc'
 
+# Seconds a vCenter session may go unused before it is logged out.
+SESSION_IDLE_TIMEOUT = getattr(settings, 'VCENTER_SESSION_IDLE_TIMEOUT', 600)
+# Seconds a vCenter session may go unused before checking it is still logged
+# in, before using it again.
+SESSION_CHECK_INTERVAL = getattr(settings, 'VCENTER_SESSION_CHECK_INTERVAL',
+                                 60)
+
+# Most objects the property collector returns in one call.
+PROPERTY_COLLECTOR_PAGE_SIZE = 1000
+
+# Logged in vCenter service instances, keyed by (vcenter, username, password
+# digest), as [service instance, time last used].
+_sessions = {}
+_sessions_lock = threading.Lock()
+# Process whose thread logs out of idle sessions, which forked processes
+# need to start again.
+_evictor = {'pid': None}
+
 def _get_vcenter_data():
     filename = settings.VCENTER_SETTINGS
     if not os.path.exists(filename):
         LOG.info('No file %s' % filename)
         return {}
 
-    with open(filename, 'r') as fp:
-        fcntl.flock(fp, fcntl.LOCK_SH)
-        file_contents = fp.read()
-        fcntl.flock(fp, fcntl.LOCK_UN)
-    return yaml.load(file_contents)
+    return yaml.load(filename)
+
+
+def password_digest(password):
+    """Returns a digest of the password, for keeping track of what was
+    looked up with it without holding on to the password itself.
+    """
+    if isinstance(password, unicode):
+        password = password.encode('utf-8')
+    return hashlib.sha256(password or '').hexdigest()
+
+
+def _session_key(vcenter, username, password):
+    return (vcenter, username, password_digest(password))
+
+
+def _logout(service_instance):
+    try:
+        connect.Disconnect(service_instance)
+    except Exception, e:
+        LOG.debug('Could not log out of vCenter session: %s' % e)
+
+
+def _is_logged_in(service_instance):
+    # Return True if the vCenter still knows the session.
+    try:
+        content = service_instance.RetrieveContent()
+        return content.sessionManager.currentSession is not None
+    except Exception, e:
+        LOG.debug('vCenter session check failed: %s' % e)
+        return False
+
+
+def _evict_idle_sessions(now):
+    # Log out of sessions that have not been used in a while.
+    idle = []
+    with _sessions_lock:
+        for key, (service_instance, last_used) in _sessions.items():
+            if now - last_used > SESSION_IDLE_TIMEOUT:
+                idle.append(service_instance)
+                del _sessions[key]
+    for service_instance in idle:
+        _logout(service_instance)
+
+
+def _evict_periodically():
+    # Log out of idle sessions, even if no more are asked for.
+    interval = max(min(SESSION_IDLE_TIMEOUT / 2.0, 60), 1)
+    while True:
+        time.sleep(interval)
+        _evict_idle_sessions(time.time())
+
+
+def _start_evictor():
+    # Start the thread logging out of idle sessions, if this process has not
+    # yet. Must hold _sessions_lock.
+    pid = os.getpid()
+    if _evictor['pid'] == pid:
+        return
+    _evictor['pid'] = pid
+    thread = threading.Thread(target=_evict_periodically,
+                              name='vcenter-session-evictor')
+    thread.daemon = True
+    thread.start()
+
+
+@atexit.register
+def close_sessions():
+    """Log out of all pooled vCenter sessions."""
+    with _sessions_lock:
+        sessions = _sessions.values()
+        _sessions.clear()
+    for service_instance, last_used in sessions:
+        _logout(service_instance)
 
 
 def vcenter_connection(vcenter, username, password):
     """Returns a vCenter service instance, connected with the given login
     information.
+
+    Sessions are pooled, so a session logged in earlier with the same login
+    information is used again while it is still valid.
     """
     if not all([vcenter, username, password]):
         LOG.error('vCenter host, username, and password required')
         return None
+
+    now = time.time()
+    _evict_idle_sessions(now)
+    key = _session_key(vcenter, username, password)
+    with _sessions_lock:
+        # Noted as used as it is checked out, so it is not logged out while
+        # in use.
+        session = _sessions.get(key)
+        if session:
+            service_instance, last_used = session
+            session[1] = now
+    if session:
+        if (now - last_used < SESSION_CHECK_INTERVAL or
+                _is_logged_in(service_instance)):
+            return service_instance
+        LOG.debug('vCenter session for %s@%s expired' % (username, vcenter))
+        with _sessions_lock:
+            if _sessions.get(key) is session:
+                del _sessions[key]
+        _logout(service_instance)
+
     try:
         service_instance = connect.SmartConnect(host=vcenter, user=username,
                                                 pwd=password,
@@ -81,40 +196,108 @@ def vcenter_connection(vcenter, username, password):
     except requests_exceptions.ConnectionError as e:
         LOG.error('Could not connect to %s: %s' % (vcenter, e.message))
         return None
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session:
+            # Another thread logged in at the same time.
+            duplicate = service_instance
+            service_instance = session[0]
+            session[1] = now
+        else:
+            duplicate = None
+            _sessions[key] = [service_instance, now]
+        _start_evictor()
+    if duplicate:
+        _logout(duplicate)
     return service_instance
 
 
-def get_comp_vc():
+def retrieve_properties(content, root, properties):
+    """Returns the given properties of all objects of the given types under
+    root, as a dict of property values keyed by property path, keyed by
+    managed object.
+
+    'properties' is a dict of property paths keyed by vim type. Everything is
+    retrieved with the property collector, a page at a time, rather than with
+    a round trip for each property of each object.
+    """
+    view = content.viewManager.CreateContainerView(root, properties.keys(),
+                                                   True)
+    try:
+        traversal_spec = vmodl.query.PropertyCollector.TraversalSpec(
+            name='traverseView', path='view', skip=False,
+            type=vim.view.ContainerView)
+        object_spec = vmodl.query.PropertyCollector.ObjectSpec(
+            obj=view, skip=True, selectSet=[traversal_spec])
+        property_specs = [
+            vmodl.query.PropertyCollector.PropertySpec(
+                type=vim_type, pathSet=paths, all=False)
+            for vim_type, paths in properties.items()]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(
+            objectSet=[object_spec], propSet=property_specs)
+        options = vmodl.query.PropertyCollector.RetrieveOptions(
+            maxObjects=PROPERTY_COLLECTOR_PAGE_SIZE)
+
+        collector = content.propertyCollector
+        objects = {}
+        result = collector.RetrievePropertiesEx([filter_spec], options)
+        while result:
+            for obj in result.objects:
+                objects[obj.obj] = dict((prop.name, prop.val)
+                                        for prop in obj.propSet)
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return objects
+    finally:
+        view.Destroy()
+
+
+def _get_names(content, root, vim_type, name=None):
+    # Return objects of the given type under root keyed by name, optionally
+    # limited to only the one with the given name.
+    objects = retrieve_properties(content, root, {vim_type: ['name']})
+    objects_by_name = {}
+    for obj, props in objects.items():
+        obj_name = props.get('name')
+        if name and obj_name != name:
+            continue
+        objects_by_name[obj_name] = obj
+    return objects_by_name
+
+
+def get_comp_vc(caller=None):
     """Returns valid value for compute vCenter."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(COMP_VC, ''): None }
 
 
-def get_mgmt_vc():
+def get_mgmt_vc(caller=None):
     """Returns valid value for management vCenter."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(MGMT_VC, ''): None }
 
 
-def get_comp_vc_username():
+def get_comp_vc_username(caller=None):
     """Returns valid value for compute vCenter login username."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(COMP_VC_USERNAME, ''): None }
 
 
-def get_mgmt_vc_username():
+def get_mgmt_vc_username(caller=None):
     """Returns valid value for management vCenter login username."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(MGMT_VC_USERNAME, ''): None }
 
 
-def get_comp_vc_password():
+def get_comp_vc_password(caller=None):
     """Returns valid value for compute vCenter login password."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(COMP_VC_PASSWORD, ''): None }
 
 
-def get_mgmt_vc_password():
+def get_mgmt_vc_password(caller=None):
     """Returns valid value for management vCenter login password."""
     vcenter_data = _get_vcenter_data()
     return { vcenter_data.get(MGMT_VC_PASSWORD, ''): None }
@@ -141,28 +324,19 @@ def _get_datacenters(content=None, vcenter_field=None, username_field=None,
         if not service_instance:
             return None
         content = service_instance.RetrieveContent()
-        connect.Disconnect
 
-    dcview = content.viewManager.CreateContainerView(content.rootFolder,
-                                                     [vim.Datacenter], True)
-    datacenters = dcview.view
-    dcview.Destroy()
-
-    datacenters_by_name = {}
-    for dc in datacenters:
-        if datacenter and dc.name != datacenter:
-            continue
-        datacenters_by_name[dc.name] = dc
-    return datacenters_by_name
+    return _get_names(content, content.rootFolder, vim.Datacenter,
+                      name=datacenter)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='comp_vc_datacenter')
 def get_comp_vc_datacenter(vcenter=None, username=None, password=None,
-                           datacenter=None):
+                           datacenter=None, caller=None):
     """Returns a dict of datacenters in the compute vCenter, keyed by name,
     optionally limited to only the given datacenter. Pass in empty string for
     'datacenter' to get all datacenters.
     """
-    LOG.debug('get_comp_vc_datacenters caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_comp_vc_datacenters caller: %s', caller)
     return _get_datacenters(
         vcenter_field=COMP_VC, username_field=COMP_VC_USERNAME,
         password_field=COMP_VC_PASSWORD, datacenter_field=COMP_VC_DATACENTER,
@@ -170,13 +344,14 @@ def get_comp_vc_datacenter(vcenter=None, username=None, password=None,
         datacenter=datacenter)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='mgmt_vc_datacenter')
 def get_mgmt_vc_datacenter(vcenter=None, username=None, password=None,
-                           datacenter=None):
+                           datacenter=None, caller=None):
     """Returns a dict of datacenters in the management vCenter, keyed by
     name, optionally limited to only the given datacenter. Pass in empty string
     for 'datacenter' to get all datacenters.
     """
-    LOG.debug('get_mgmt_vc_datacenters caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_mgmt_vc_datacenters caller: %s', caller)
     return _get_datacenters(
         vcenter_field=MGMT_VC, username_field=MGMT_VC_USERNAME,
         password_field=MGMT_VC_PASSWORD, datacenter_field=MGMT_VC_DATACENTER,
@@ -208,32 +383,23 @@ def _get_clusters(content=None, vcenter_field=None, username_field=None,
         if not service_instance:
             return None
         content = service_instance.RetrieveContent()
-        connect.Disconnect
 
     datacenters = _get_datacenters(content=content, datacenter=datacenter)
     clusters_by_name = {}
-    for dc_name, dc in datacenters.items():
-        if datacenter and dc_name != datacenter:
-            continue
-        clusterview = content.viewManager.CreateContainerView(
-            dc, [vim.ClusterComputeResource], True)
-        clusters = clusterview.view
-        clusterview.Destroy()
-
-        for cl in clusters:
-            if cluster and cl.name != cluster:
-                continue
-            clusters_by_name[cl.name] = cl
+    for dc in datacenters.values():
+        clusters_by_name.update(_get_names(
+            content, dc, vim.ClusterComputeResource, name=cluster))
     return clusters_by_name
 
 
+@metrics.timed('chaperone_getter_seconds', getter='comp_vc_cluster')
 def get_comp_vc_cluster(vcenter=None, username=None, password=None,
-                        datacenter=None, cluster=None):
+                        datacenter=None, cluster=None, caller=None):
     """Returns a dict of clusters in the compute vCenter, optionally only from
     the given datacenter and limited to only the given cluster. Pass in empty
     string for 'datacenter'/'cluster' to get all datacenters/clusters.
     """
-    LOG.debug('get_comp_vc_clusters caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_comp_vc_clusters caller: %s', caller)
     return _get_clusters(
         vcenter_field=COMP_VC, username_field=COMP_VC_USERNAME,
         password_field=COMP_VC_PASSWORD, datacenter_field=COMP_VC_DATACENTER,
@@ -241,13 +407,14 @@ def get_comp_vc_cluster(vcenter=None, username=None, password=None,
         password=password, datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='mgmt_vc_cluster')
 def get_mgmt_vc_cluster(vcenter=None, username=None, password=None,
-                        datacenter=None, cluster=None):
+                        datacenter=None, cluster=None, caller=None):
     """Returns a dict of clusters in the management vCenter, optionally only
     from the given datacenter and limited to only the given cluster. Pass in
     empty string for 'datacenter'/'cluster' to get all datacenters/clusters.
     """
-    LOG.debug('get_mgmt_vc_clusters caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_mgmt_vc_clusters caller: %s', caller)
     return _get_clusters(
         vcenter_field=MGMT_VC, username_field=MGMT_VC_USERNAME,
         password_field=MGMT_VC_PASSWORD, datacenter_field=MGMT_VC_DATACENTER,
@@ -255,9 +422,12 @@ def get_mgmt_vc_cluster(vcenter=None, username=None, password=None,
         password=password, datacenter=datacenter, cluster=cluster)
 
 
-def _get_hosts(vcenter_field=None, username_field=None, password_field=None,
-               datacenter_field=None, cluster_field=None, vcenter=None,
-               username=None, password=None, datacenter=None, cluster=None):
+def _get_host_properties(paths, vcenter_field=None, username_field=None,
+                         password_field=None, datacenter_field=None,
+                         cluster_field=None, vcenter=None, username=None,
+                         password=None, datacenter=None, cluster=None):
+    # Return the vCenter content, the datacenters searched and the given
+    # properties of the hosts in the clusters, keyed by host.
     if not all([vcenter, username, password, datacenter, cluster]):
         vcenter_data = _get_vcenter_data()
     if vcenter is None:
@@ -273,29 +443,70 @@ def _get_hosts(vcenter_field=None, username_field=None, password_field=None,
 
     service_instance = vcenter_connection(vcenter, username, password)
     if not service_instance:
-        return None
+        return None, None, None
     content = service_instance.RetrieveContent()
-    connect.Disconnect
 
-    clusters = _get_clusters(content=content, datacenter=datacenter,
-                             cluster=cluster)
-    hosts_by_name = {}
-    for cl_name, cl in clusters.items():
-        if cluster and cl_name != cluster:
-            continue
-        hostsview = content.viewManager.CreateContainerView(
-            cl, [vim.HostSystem], True)
-        hosts = hostsview.view
-        hostsview.Destroy()
+    datacenters = _get_datacenters(content=content, datacenter=datacenter)
+    hosts = {}
+    for dc in datacenters.values():
+        clusters = _get_names(content, dc, vim.ClusterComputeResource,
+                              name=cluster)
+        for cl in clusters.values():
+            hosts.update(retrieve_properties(content, cl,
+                                              {vim.HostSystem: paths}))
+    return content, datacenters, hosts
+
 
-        for host in hosts:
-            hosts_by_name[host.name] = host
+def _get_hosts(vcenter_field=None, username_field=None, password_field=None,
+               datacenter_field=None, cluster_field=None, vcenter=None,
+               username=None, password=None, datacenter=None, cluster=None):
+    content, datacenters, hosts = _get_host_properties(
+        ['name'], vcenter_field=vcenter_field, username_field=username_field,
+        password_field=password_field, datacenter_field=datacenter_field,
+        cluster_field=cluster_field, vcenter=vcenter, username=username,
+        password=password, datacenter=datacenter, cluster=cluster)
+    if hosts is None:
+        return None
+
+    hosts_by_name = {}
+    for host, props in hosts.items():
+        hosts_by_name[props.get('name')] = host
     return hosts_by_name
 
 
+def _get_host_references(vim_type, path, vcenter_field=None,
+                         username_field=None, password_field=None,
+                         datacenter_field=None, cluster_field=None,
+                         vcenter=None, username=None, password=None,
+                         datacenter=None, cluster=None):
+    # Return objects of the given type referenced by the given property of
+    # the hosts in the clusters, keyed by name.
+    content, datacenters, hosts = _get_host_properties(
+        [path], vcenter_field=vcenter_field, username_field=username_field,
+        password_field=password_field, datacenter_field=datacenter_field,
+        cluster_field=cluster_field, vcenter=vcenter, username=username,
+        password=password, datacenter=datacenter, cluster=cluster)
+    if hosts is None:
+        return None
+
+    referenced = set()
+    for props in hosts.values():
+        referenced.update(props.get(path, []))
+
+    # Look up the names of all of them at once.
+    objects_by_name = {}
+    for dc in datacenters.values():
+        for name, obj in _get_names(content, dc, vim_type).items():
+            if obj in referenced:
+                objects_by_name[name] = obj
+    return objects_by_name
+
+
+@metrics.timed('chaperone_getter_seconds', getter='comp_vc_hosts')
 def get_comp_vc_hosts(vcenter=None, username=None, password=None,
-                      datacenter=None, cluster=None):
+                      datacenter=None, cluster=None, caller=None):
     """Returns a dict of hosts in the saved compute vCenter cluster."""
+    LOG.debug('get_comp_vc_hosts caller: %s', caller)
     return _get_hosts(
         vcenter_field=COMP_VC, username_field=COMP_VC_USERNAME,
         password_field=COMP_VC_PASSWORD, datacenter_field=COMP_VC_DATACENTER,
@@ -303,9 +514,11 @@ def get_comp_vc_hosts(vcenter=None, username=None, password=None,
         password=password, datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='mgmt_vc_hosts')
 def get_mgmt_vc_hosts(vcenter=None, username=None, password=None,
-                      datacenter=None, cluster=None):
+                      datacenter=None, cluster=None, caller=None):
     """Returns a dict of hosts in the saved management vCenter cluster."""
+    LOG.debug('get_mgmt_vc_hosts caller: %s', caller)
     return _get_hosts(
         vcenter_field=MGMT_VC, username_field=MGMT_VC_USERNAME,
         password_field=MGMT_VC_PASSWORD, datacenter_field=MGMT_VC_DATACENTER,
@@ -317,25 +530,19 @@ def _get_datastores(vcenter_field=None, username_field=None,
                     password_field=None, datacenter_field=None,
                     cluster_field=None, vcenter=None, username=None,
                     password=None, datacenter=None, cluster=None):
-    hosts = _get_hosts(
-        vcenter_field=vcenter_field, username_field=username_field,
-        password_field=password_field, datacenter_field=datacenter_field,
-        cluster_field=cluster_field, vcenter=vcenter, username=username,
-        password=password, datacenter=datacenter, cluster=cluster)
-    if not hosts:
-        return None
-    datastores_by_name = {}
-
-    for host in hosts.values():
-        for datastore in host.datastore:
-            datastores_by_name[datastore.name] = datastore
-    return datastores_by_name
+    return _get_host_references(
+        vim.Datastore, 'datastore', vcenter_field=vcenter_field,
+        username_field=username_field, password_field=password_field,
+        datacenter_field=datacenter_field, cluster_field=cluster_field,
+        vcenter=vcenter, username=username, password=password,
+        datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='comp_vc_datastores')
 def get_comp_vc_datastores(vcenter=None, username=None, password=None,
-                           datacenter=None, cluster=None):
+                           datacenter=None, cluster=None, caller=None):
     """Returns a dict of datastores in the saved compute vCenter cluster."""
-    LOG.debug('get_comp_vc_datastores caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_comp_vc_datastores caller: %s', caller)
     return _get_datastores(
         vcenter_field=COMP_VC, username_field=COMP_VC_USERNAME,
         password_field=COMP_VC_PASSWORD, datacenter_field=COMP_VC_DATACENTER,
@@ -343,10 +550,11 @@ def get_comp_vc_datastores(vcenter=None, username=None, password=None,
         password=password, datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='mgmt_vc_datastores')
 def get_mgmt_vc_datastores(vcenter=None, username=None, password=None,
-                           datacenter=None, cluster=None):
+                           datacenter=None, cluster=None, caller=None):
     """Returns a dict of datastores in the saved management vCenter."""
-    LOG.debug('get_mgmt_vc_datastores caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_mgmt_vc_datastores caller: %s', caller)
     return _get_datastores(
         vcenter_field=MGMT_VC, username_field=MGMT_VC_USERNAME,
         password_field=MGMT_VC_PASSWORD, datacenter_field=MGMT_VC_DATACENTER,
@@ -357,25 +565,19 @@ def get_mgmt_vc_datastores(vcenter=None, username=None, password=None,
 def _get_networks(vcenter_field=None, username_field=None, password_field=None,
                   datacenter_field=None, cluster_field=None, vcenter=None,
                   username=None, password=None, datacenter=None, cluster=None):
-    hosts = _get_hosts(
-        vcenter_field=vcenter_field, username_field=username_field,
-        password_field=password_field, datacenter_field=datacenter_field,
-        cluster_field=cluster_field, vcenter=vcenter, username=username,
-        password=password, datacenter=datacenter, cluster=cluster)
-    if not hosts:
-        return None
-    networks_by_name = {}
-
-    for host in hosts.values():
-        for network in host.network:
-            networks_by_name[network.name] = network
-    return networks_by_name
+    return _get_host_references(
+        vim.Network, 'network', vcenter_field=vcenter_field,
+        username_field=username_field, password_field=password_field,
+        datacenter_field=datacenter_field, cluster_field=cluster_field,
+        vcenter=vcenter, username=username, password=password,
+        datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='comp_vc_networks')
 def get_comp_vc_networks(vcenter=None, username=None, password=None,
-                         datacenter=None, cluster=None):
+                         datacenter=None, cluster=None, caller=None):
     """Returns a dict of networks in the saved compute vCenter cluster."""
-    LOG.debug('get_comp_vc_networks caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_comp_vc_networks caller: %s', caller)
     return _get_networks(
         vcenter_field=COMP_VC, username_field=COMP_VC_USERNAME,
         password_field=COMP_VC_PASSWORD, datacenter_field=COMP_VC_DATACENTER,
@@ -383,10 +585,11 @@ def get_comp_vc_networks(vcenter=None, username=None, password=None,
         password=password, datacenter=datacenter, cluster=cluster)
 
 
+@metrics.timed('chaperone_getter_seconds', getter='mgmt_vc_networks')
 def get_mgmt_vc_networks(vcenter=None, username=None, password=None,
-                         datacenter=None, cluster=None):
+                         datacenter=None, cluster=None, caller=None):
     """Returns a dict of networks in the saved management vCenter cluster."""
-    LOG.debug('get_mgmt_vc_networks caller: %s', inspect.stack()[1][3])
+    LOG.debug('get_mgmt_vc_networks caller: %s', caller)
     return _get_networks(
         vcenter_field=MGMT_VC, username_field=MGMT_VC_USERNAME,
         password_field=MGMT_VC_PASSWORD, datacenter_field=MGMT_VC_DATACENTER,
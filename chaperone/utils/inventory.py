@@ -0,0 +1,357 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Snapshot of a vCenter's inventory, read in a single pass, for when all of
+# the datacenters, clusters, hosts, datastores and networks are needed at once.
+
+import logging
+import os
+import time
+
+from django.conf import settings
+from pyVmomi import vim
+
+from chaperone.utils import cache, getters, tasks, yaml
+
+
+LOG = logging.getLogger(__name__)
+
+MIN_MGMT_NETWORKS = 1
+
+# File noting when INPUT_OPTIONS was last rebuilt.
+OPTIONS_STATUS = getattr(settings, 'INPUT_OPTIONS_STATUS',
+                         '%s.status' % settings.INPUT_OPTIONS)
+
+# Options looked up for vCenter form fields, keyed by (vcenter, username,
+# password digest, datacenter, cluster, field id).
+_options_cache = cache.TTLCache(
+    getattr(settings, 'INVENTORY_CACHE_TTL', 300),
+    getattr(settings, 'INVENTORY_CACHE_SIZE', 256))
+
+# Properties read for each type of object in the inventory.
+PROPERTIES = {
+    vim.Datacenter: ['name'],
+    vim.Folder: ['parent'],
+    vim.ClusterComputeResource: ['name', 'parent'],
+    vim.HostSystem: ['name', 'parent', 'datastore', 'network'],
+    vim.Datastore: ['name'],
+    vim.Network: ['name'],
+}
+
+
+class Inventory(object):
+    """Names of the datacenters in a vCenter, the clusters in them, and the
+    hosts, datastores and networks in each cluster.
+
+    Only hosts in clusters are included, as with the getters.
+    """
+
+    def __init__(self, objects):
+        # { 'Datacenter': { 'Cluster': { 'Host': {
+        #     'datastores': set([...]), 'networks': set([...]) } } } }
+        self.datacenters = {}
+
+        def get_name(obj):
+            return objects.get(obj, {}).get('name')
+
+        def get_datacenter(obj):
+            # Clusters are in the datacenter's host folder, which may have
+            # other folders in between.
+            while obj is not None and not isinstance(obj, vim.Datacenter):
+                obj = objects.get(obj, {}).get('parent')
+            return obj
+
+        clusters = {}
+        for obj, props in objects.items():
+            if isinstance(obj, vim.Datacenter):
+                self.datacenters.setdefault(props.get('name'), {})
+            elif isinstance(obj, vim.ClusterComputeResource):
+                dc_name = get_name(get_datacenter(props.get('parent')))
+                if dc_name is None:
+                    continue
+                hosts = self.datacenters.setdefault(dc_name, {}).setdefault(
+                    props.get('name'), {})
+                clusters[obj] = hosts
+
+        for obj, props in objects.items():
+            if not isinstance(obj, vim.HostSystem):
+                continue
+            hosts = clusters.get(props.get('parent'))
+            if hosts is None:
+                # Standalone host.
+                continue
+            hosts[props.get('name')] = {
+                'datastores': set(get_name(ds)
+                                  for ds in props.get('datastore', [])),
+                'networks': set(get_name(net)
+                                for net in props.get('network', [])),
+            }
+
+    def _get_clusters(self, datacenter=None, cluster=None):
+        # Return clusters' hosts in the given datacenter, or all datacenters,
+        # limited to the given cluster.
+        for dc_name, clusters in self.datacenters.items():
+            if datacenter and dc_name != datacenter:
+                continue
+            for cl_name, hosts in clusters.items():
+                if cluster and cl_name != cluster:
+                    continue
+                yield cl_name, hosts
+
+    def get_datacenters(self):
+        """Returns names of all datacenters."""
+        return sorted(self.datacenters.keys())
+
+    def get_clusters(self, datacenter=None):
+        """Returns names of clusters, optionally only in the given
+        datacenter.
+        """
+        return sorted(set(name for name, hosts
+                          in self._get_clusters(datacenter)))
+
+    def get_hosts(self, datacenter=None, cluster=None):
+        """Returns names of hosts, optionally only in the given datacenter
+        and cluster.
+        """
+        names = set()
+        for cl_name, hosts in self._get_clusters(datacenter, cluster):
+            names.update(hosts.keys())
+        return sorted(names)
+
+    def get_datastores(self, datacenter=None, cluster=None):
+        """Returns names of datastores used by hosts, optionally only in the
+        given datacenter and cluster.
+        """
+        names = set()
+        for cl_name, hosts in self._get_clusters(datacenter, cluster):
+            for host in hosts.values():
+                names.update(host['datastores'])
+        return sorted(names)
+
+    def get_networks(self, datacenter=None, cluster=None):
+        """Returns names of networks used by hosts, optionally only in the
+        given datacenter and cluster.
+        """
+        names = set()
+        for cl_name, hosts in self._get_clusters(datacenter, cluster):
+            for host in hosts.values():
+                names.update(host['networks'])
+        return sorted(names)
+
+
+def snapshot(vcenter, username, password):
+    """Returns the Inventory of the vCenter, or None if unable to log in."""
+    service_instance = getters.vcenter_connection(vcenter, username, password)
+    if not service_instance:
+        return None
+    content = service_instance.RetrieveContent()
+    LOG.debug('Reading inventory of %s' % vcenter)
+    objects = getters.retrieve_properties(content, content.rootFolder,
+                                          PROPERTIES)
+    return Inventory(objects)
+
+
+def _get_vcenter_options(vcenter, username, password, datacenter, cluster,
+                         datacenter_field, cluster_field, hosts_field,
+                         datastores_field, networks_field, description,
+                         min_networks=0):
+    # Return the options for the vCenter's fields, and errors for any that
+    # have none.
+    options_data = {}
+    errors = []
+
+    # Read everything needed from the vCenter in one pass.
+    vc_inventory = snapshot(vcenter, username, password)
+
+    # Get datacenters.
+    datacenters = None
+    if vc_inventory:
+        datacenters = vc_inventory.get_datacenters()
+    if not datacenters:
+        errors.append('No %s vCenter datacenters found.' % description)
+        return options_data, errors
+    options_data[datacenter_field] = datacenters
+
+    # Get clusters in the datacenter.
+    clusters = vc_inventory.get_clusters(datacenter=datacenter)
+    if not clusters:
+        errors.append('No %s vCenter clusters found.' % description)
+        return options_data, errors
+    options_data[cluster_field] = clusters
+
+    # Get hosts in the cluster.
+    hosts = vc_inventory.get_hosts(datacenter=datacenter, cluster=cluster)
+    if not hosts:
+        errors.append('No %s vCenter hosts found.' % description)
+    else:
+        options_data[hosts_field] = hosts
+
+    # Get datastores in the cluster.
+    datastores = vc_inventory.get_datastores(datacenter=datacenter,
+                                             cluster=cluster)
+    if not datastores:
+        errors.append('No %s vCenter datastores found.' % description)
+    else:
+        options_data[datastores_field] = datastores
+
+    # Get networks in the cluster.
+    networks = vc_inventory.get_networks(datacenter=datacenter,
+                                         cluster=cluster)
+    if len(networks) < min_networks:
+        errors.append(
+            'At least %s %s vCenter network%s must be available.' % (
+                min_networks, description, '' if min_networks == 1 else 's'))
+    else:
+        options_data[networks_field] = networks
+    return options_data, errors
+
+
+def get_options(vcenter_data):
+    """Returns the options for all vCenter fields, as saved to INPUT_OPTIONS,
+    for the vCenter settings given, along with a list of errors for fields
+    with no options.
+
+    The management and compute vCenters are read at the same time.
+    """
+    options_data = {}
+    errors = []
+    for field in (getters.COMP_VC, getters.COMP_VC_USERNAME,
+                  getters.COMP_VC_PASSWORD, getters.MGMT_VC,
+                  getters.MGMT_VC_USERNAME, getters.MGMT_VC_PASSWORD):
+        options_data[field] = [vcenter_data.get(field, '')]
+
+    vcenters = [
+        ('management', getters.MGMT_VC, getters.MGMT_VC_USERNAME,
+         getters.MGMT_VC_PASSWORD, getters.MGMT_VC_DATACENTER,
+         getters.MGMT_VC_CLUSTER, getters.MGMT_VC_HOSTS,
+         getters.MGMT_VC_DATASTORES, getters.MGMT_VC_NETWORKS,
+         MIN_MGMT_NETWORKS),
+        ('compute', getters.COMP_VC, getters.COMP_VC_USERNAME,
+         getters.COMP_VC_PASSWORD, getters.COMP_VC_DATACENTER,
+         getters.COMP_VC_CLUSTER, getters.COMP_VC_HOSTS,
+         getters.COMP_VC_DATASTORES, getters.COMP_VC_NETWORKS, 0),
+    ]
+    calls = []
+    for (description, vcenter_field, username_field, password_field,
+         datacenter_field, cluster_field, hosts_field, datastores_field,
+         networks_field, min_networks) in vcenters:
+        calls.append((_get_vcenter_options, (), {
+            'vcenter': vcenter_data.get(vcenter_field),
+            'username': vcenter_data.get(username_field),
+            'password': vcenter_data.get(password_field),
+            'datacenter': vcenter_data.get(datacenter_field),
+            'cluster': vcenter_data.get(cluster_field),
+            'datacenter_field': datacenter_field,
+            'cluster_field': cluster_field,
+            'hosts_field': hosts_field,
+            'datastores_field': datastores_field,
+            'networks_field': networks_field,
+            'description': description,
+            'min_networks': min_networks,
+        }))
+
+    results = tasks.run_all(calls)
+    for vcenter, (result, error) in zip(vcenters, results):
+        if error:
+            errors.append('Unable to read %s vCenter inventory: %s.' %
+                          (vcenter[0], error))
+            continue
+        vcenter_options, vcenter_errors = result
+        options_data.update(vcenter_options)
+        errors.extend(vcenter_errors)
+    return options_data, errors
+
+
+def _get_options_saved_time():
+    # Return when vCenter settings were last saved, from any process.
+    try:
+        return os.path.getmtime(settings.INPUT_OPTIONS)
+    except OSError:
+        return None
+
+
+def get_field_options(field_id, vcenter, username, password, datacenter=None,
+                      cluster=None):
+    """Returns (option names, age) for the vCenter form field, where option
+    names is None if unable to log in to the vCenter.
+
+    Options are cached for INVENTORY_CACHE_TTL seconds, or until vCenter
+    settings are saved. The age is how many seconds ago the cached options
+    were looked up, or None if they were just looked up.
+    """
+    key = (vcenter, username, getters.password_digest(password), datacenter,
+           cluster, field_id)
+    cached = _options_cache.get(key, newer_than=_get_options_saved_time())
+    if cached:
+        return cached
+
+    fn_name = 'get_%s' % field_id
+    fn = getattr(getters, fn_name)
+    kwargs = {
+        'vcenter': vcenter,
+        'username': username,
+        'password': password,
+        'caller': 'get_field_options',
+    }
+    if datacenter is not None:
+        kwargs['datacenter'] = datacenter
+    if cluster is not None:
+        kwargs['cluster'] = cluster
+    options = fn(**kwargs)
+    if options is None:
+        return None, None
+
+    opt_names = sorted(options.keys())
+    _options_cache.set(key, opt_names)
+    return opt_names, None
+
+
+def invalidate_field_options():
+    """Drops all cached vCenter form field options."""
+    _options_cache.invalidate()
+
+
+def _is_saved(options_data):
+    # Return True if INPUT_OPTIONS already holds the options, as they would
+    # be written.
+    try:
+        with open(settings.INPUT_OPTIONS, 'r') as fp:
+            return fp.read() == yaml.dumps(options_data)
+    except IOError:
+        return False
+
+
+def save_options(options_data):
+    """Replaces INPUT_OPTIONS with the given vCenter field options, unless
+    they are unchanged, and notes when it was done. Returns True if they
+    changed.
+
+    Leaving unchanged options alone keeps whatever depends on their version
+    from being rebuilt.
+    """
+    changed = not _is_saved(options_data)
+    if changed:
+        yaml.dump(settings.INPUT_OPTIONS, options_data, atomic=True)
+        # Options looked up before are out of date.
+        invalidate_field_options()
+        LOG.info('vCenter options saved to %s' % settings.INPUT_OPTIONS)
+    yaml.dump(OPTIONS_STATUS, {'refreshed': time.time()}, atomic=True)
+    return changed
+
+
+def get_options_refreshed_time():
+    """Returns when INPUT_OPTIONS was last rebuilt, or None if unknown."""
+    return yaml.load(OPTIONS_STATUS).get('refreshed')
@@ -0,0 +1,293 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Request counts and timings, in the Prometheus text format.
+#
+# Each web server process keeps its own counts, and saves them to a file of
+# its own in METRICS_DIR every so often. Reports add up the files of all
+# processes, so they cover every worker, whichever one handles the report.
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+
+from chaperone.utils import system
+
+
+LOG = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the histogram buckets.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+# Name: (type, help)
+METRICS = {
+    'chaperone_http_requests_total': (
+        'counter', 'Requests handled, by view, method and status code.'),
+    'chaperone_http_request_duration_seconds': (
+        'histogram', 'Time taken to handle requests, by view.'),
+    'chaperone_yaml_seconds': (
+        'histogram', 'Time taken to load, parse and dump YAML files.'),
+    'chaperone_prepare_sections_seconds': (
+        'histogram', 'Time taken to get the sections of prepare groups.'),
+    'chaperone_getter_seconds': (
+        'histogram', 'Time taken by getters looking up vCenter inventory.'),
+    'chaperone_template_render_seconds': (
+        'histogram', 'Time taken to render templates, by template.'),
+}
+
+# Counts of processes that have exited, added to those of running ones.
+ARCHIVE_NAME = 'archive.json'
+
+_lock = threading.Lock()
+# Counts of this process, started over in processes forked from it.
+_state = {
+    'pid': None,
+    'filename': None,
+    'flushed': 0,
+    # (name, labels): value
+    'counters': {},
+    # (name, labels): [count in each bucket, sum, count]
+    'histograms': {},
+}
+
+
+def _get_dir():
+    return getattr(settings, 'CHAPERONE_METRICS_DIR',
+                   os.path.join(settings.CHAPERONE_LOG_DIR, 'metrics'))
+
+
+def _get_state():
+    # Return the counts of this process. Must hold _lock.
+    pid = os.getpid()
+    if _state['pid'] != pid:
+        _state['pid'] = pid
+        _state['filename'] = '%d.%s.json' % (pid, uuid.uuid4().hex)
+        _state['flushed'] = 0
+        _state['counters'] = {}
+        _state['histograms'] = {}
+    return _state
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, u'%s' % v) for k, v in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Adds to the counter with the given labels."""
+    key = _key(name, labels)
+    with _lock:
+        counters = _get_state()['counters']
+        counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Adds a value, usually seconds taken, to the histogram with the given
+    labels.
+    """
+    key = _key(name, labels)
+    with _lock:
+        histograms = _get_state()['histograms']
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * len(BUCKETS) + [0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += value
+        histogram[-1] += 1
+
+
+@contextmanager
+def timer(name, **labels):
+    """Adds the time taken by the block to the histogram."""
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+
+def timed(name, **labels):
+    """Decorator adding the time taken by each call to the histogram."""
+    def _decorator(func):
+        @wraps(func)
+        def _wrapped(*args, **kwargs):
+            with timer(name, **labels):
+                return func(*args, **kwargs)
+        return _wrapped
+    return _decorator
+
+
+def _to_json(state):
+    return {
+        'counters': [[name, labels, value] for (name, labels), value
+                     in state['counters'].items()],
+        'histograms': [[name, labels, values] for (name, labels), values
+                       in state['histograms'].items()],
+    }
+
+
+def _add(totals, data):
+    # Add counts saved to a file to the totals.
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(tuple(label) for label in labels))
+        totals['counters'][key] = totals['counters'].get(key, 0) + value
+    for name, labels, values in data.get('histograms', []):
+        key = (name, tuple(tuple(label) for label in labels))
+        histogram = totals['histograms'].get(key)
+        if histogram is None:
+            totals['histograms'][key] = list(values)
+        elif len(histogram) == len(values):
+            totals['histograms'][key] = [a + b for a, b in
+                                         zip(histogram, values)]
+
+
+def flush(force=False):
+    """Saves the counts of this process for reports, if it has been long
+    enough since they were last saved.
+    """
+    interval = getattr(settings, 'CHAPERONE_METRICS_FLUSH_INTERVAL', 5)
+    with _lock:
+        state = _get_state()
+        now = time.time()
+        if not force and now - state['flushed'] < interval:
+            return
+        state['flushed'] = now
+        data = _to_json(state)
+        filename = state['filename']
+    metrics_dir = _get_dir()
+    try:
+        if not os.path.isdir(metrics_dir):
+            os.makedirs(metrics_dir)
+        system.write_atomic(os.path.join(metrics_dir, filename),
+                            json.dumps(data))
+    except (IOError, OSError), e:
+        LOG.error('Unable to save metrics to %s: %s' % (metrics_dir, e))
+
+
+@atexit.register
+def _flush_at_exit():
+    # Save the last counts of web server processes, which are the ones that
+    # have saved them before.
+    if _state['pid'] == os.getpid() and _state['flushed']:
+        flush(force=True)
+
+
+def _load(path):
+    try:
+        with open(path, 'r') as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return {}
+
+
+def collect():
+    """Returns the counts of all processes, as {'counters': {(name, labels):
+    value}, 'histograms': {(name, labels): [count in each bucket, sum,
+    count]}}.
+
+    Counts of processes that have exited are kept in the archive, so the
+    totals never go down.
+    """
+    flush(force=True)
+    metrics_dir = _get_dir()
+    totals = {'counters': {}, 'histograms': {}}
+    if not os.path.isdir(metrics_dir):
+        return totals
+    archive = os.path.join(metrics_dir, ARCHIVE_NAME)
+    with open(os.path.join(metrics_dir, '.lock'), 'a') as lp:
+        fcntl.flock(lp, fcntl.LOCK_EX)
+        archived = {'counters': {}, 'histograms': {}}
+        _add(archived, _load(archive))
+        exited = []
+        for filename in os.listdir(metrics_dir):
+            if filename.startswith('.') or filename == ARCHIVE_NAME:
+                continue
+            path = os.path.join(metrics_dir, filename)
+            try:
+                pid = int(filename.split('.', 1)[0])
+            except ValueError:
+                continue
+            data = _load(path)
+            if system.is_running(pid):
+                _add(totals, data)
+            else:
+                _add(archived, data)
+                exited.append(path)
+        if exited:
+            system.write_atomic(archive, json.dumps(_to_json(archived)))
+            for path in exited:
+                os.remove(path)
+        fcntl.flock(lp, fcntl.LOCK_UN)
+    _add(totals, _to_json(archived))
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    labels = list(labels) + list(extra)
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, v.replace('\\', r'\\').replace('"', r'\"')
+                     .replace('\n', r'\n'))
+        for k, v in labels)
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Returns the counts of all processes in the Prometheus text format."""
+    totals = collect()
+    lines = []
+    for name in sorted(METRICS):
+        metric_type, help_text = METRICS[name]
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        if metric_type == 'counter':
+            for (key_name, labels), value in sorted(
+                    totals['counters'].items()):
+                if key_name == name:
+                    lines.append('%s%s %s' % (name, _format_labels(labels),
+                                              _format_value(value)))
+            continue
+        for (key_name, labels), values in sorted(
+                totals['histograms'].items()):
+            if key_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, values):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (
+                    name, _format_labels(labels, [('le', repr(float(bound)))]),
+                    cumulative))
+            lines.append('%s_bucket%s %d' % (
+                name, _format_labels(labels, [('le', '+Inf')]), values[-1]))
+            lines.append('%s_sum%s %s' % (name, _format_labels(labels),
+                                          _format_value(values[-2])))
+            lines.append('%s_count%s %d' % (name, _format_labels(labels),
+                                            values[-1]))
+    return '\n'.join(lines) + '\n'
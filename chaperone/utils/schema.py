@@ -0,0 +1,213 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Checks of the answer file schema against the layout described in
+# chaperone/local_settings.py.example.
+
+from django.conf import settings
+
+from chaperone.utils import getters
+
+
+def _get_items(value, where, errors):
+    # Return list of (name, value) for a list of single entry mappings, noting
+    # an error for anything else.
+    items = []
+    if not isinstance(value, list):
+        errors.append('%s must be a list.' % where)
+        return items
+    for item in value:
+        if not isinstance(item, dict) or len(item) != 1:
+            errors.append('%s must only contain "name: [...]" entries, not '
+                          '%r.' % (where, item))
+            continue
+        items.extend(item.items())
+    return items
+
+
+def get_ids(value):
+    """Returns ids given as a list, or separated by commas, as in "show" and
+    "depends_on" values.
+    """
+    if not isinstance(value, list):
+        value = str(value).split(',')
+    return [str(i).strip() for i in value if str(i).strip()]
+
+
+def _check_attribute(attr, where, errors):
+    # Check a prepare attribute, and return the ids it is saved with, and
+    # the ids it shows.
+    if not isinstance(attr, dict) or not attr.get('id'):
+        errors.append('%s: attribute must have an id: %r.' % (where, attr))
+        return [], []
+    attr_id = str(attr['id'])
+    where = '%s/%s' % (where, attr_id)
+    attr_ids = [attr_id]
+    shown_ids = get_ids(attr.get('show', ''))
+
+    input_type = str(attr.get('input', '')).lower()
+    if input_type == 'multiform':
+        try:
+            min_items = int(attr.get('min_items'))
+        except (TypeError, ValueError):
+            errors.append('%s: min_items must be a number.' % where)
+            min_items = 0
+        items = attr.get('items')
+        if not isinstance(items, list):
+            errors.append('%s: items must be a list.' % where)
+            items = []
+        for item in items:
+            # Items are saved with a copy number after their ids.
+            item_ids, item_shown_ids = _check_attribute(item, where, errors)
+            for n in range(min_items):
+                attr_ids.extend('%s_%d' % (i, n) for i in item_ids)
+
+    options = attr.get('options')
+    if isinstance(options, list):
+        for option in options:
+            if not isinstance(option, dict) or 'id' not in option:
+                errors.append('%s: option must have an id: %r.' %
+                              (where, option))
+                continue
+            shown_ids.extend(get_ids(option.get('show', '')))
+    elif options is not None:
+        if not hasattr(getters, 'get_%s' % options):
+            errors.append('%s: unknown options "%s".' % (where, options))
+    return attr_ids, shown_ids
+
+
+def _check_prepare_menu(containers, errors):
+    attr_ids = {}
+    shown_ids = set()
+    # [{ ... }]
+    for cname, groups in _get_items(containers, settings.PREPARE_MENU,
+                                    errors):
+        where = '%s/%s' % (settings.PREPARE_MENU, cname)
+        # [{ ... }]
+        for gname, sections in _get_items(groups, where, errors):
+            group_where = '%s/%s' % (where, gname)
+            # [{ ... }]
+            for sname, attributes in _get_items(sections, group_where,
+                                                errors):
+                section_where = '%s/%s' % (group_where, sname)
+                if not isinstance(attributes, list):
+                    errors.append('%s must be a list.' % section_where)
+                    continue
+                for attr in attributes:
+                    new_attr_ids, new_shown_ids = _check_attribute(
+                        attr, section_where, errors)
+                    for attr_id in new_attr_ids:
+                        if attr_id in attr_ids:
+                            errors.append('%s: id %s already used in %s.' % (
+                                section_where, attr_id, attr_ids[attr_id]))
+                        else:
+                            attr_ids[attr_id] = section_where
+                    shown_ids.update(new_shown_ids)
+
+    for attr_id in sorted(shown_ids - set(attr_ids)):
+        errors.append('%s: shows unknown id %s.' % (settings.PREPARE_MENU,
+                                                   attr_id))
+
+
+def _find_cycle(depends_on, cmd_ids, path=()):
+    # Return a list of ids that depend on each other in a loop, or None.
+    for cmd_id in cmd_ids:
+        if cmd_id in path:
+            return list(path[path.index(cmd_id):]) + [cmd_id]
+        cycle = _find_cycle(depends_on, depends_on.get(cmd_id, []),
+                            path + (cmd_id,))
+        if cycle:
+            return cycle
+    return None
+
+
+def _check_commands(commands, where, errors):
+    if not isinstance(commands, list):
+        errors.append('%s: commands must be a list.' % where)
+        return
+    depends_on = {}
+    for position, cmd in enumerate(commands):
+        cmd_id = str(position + 1)
+        if isinstance(cmd, dict):
+            cmd_id = str(cmd.get('id', cmd_id))
+            if not isinstance(cmd.get('command'), basestring):
+                errors.append('%s/%s: command must be a string.' %
+                              (where, cmd_id))
+            ids = get_ids(cmd.get('depends_on') or [])
+        elif isinstance(cmd, basestring):
+            ids = []
+        else:
+            errors.append('%s: command must be a string or mapping, not %r.' %
+                          (where, cmd))
+            continue
+        if cmd_id in depends_on:
+            errors.append('%s: command id %s already used.' % (where, cmd_id))
+        depends_on[cmd_id] = ids
+
+    for cmd_id, ids in depends_on.items():
+        for dep_id in ids:
+            if dep_id not in depends_on:
+                errors.append('%s/%s: depends on unknown command %s.' %
+                              (where, cmd_id, dep_id))
+    cycle = _find_cycle(depends_on, sorted(depends_on))
+    if cycle:
+        errors.append('%s: commands depend on each other: %s.' %
+                      (where, ' -> '.join(cycle)))
+
+
+def _check_menu(menu_name, groups, errors):
+    # [{ ... }]
+    for gname, actions in _get_items(groups, menu_name, errors):
+        where = '%s/%s' % (menu_name, gname)
+        if not isinstance(actions, list):
+            errors.append('%s must be a list.' % where)
+            continue
+        action_ids = set()
+        for act in actions:
+            if not isinstance(act, dict) or not act.get('id'):
+                errors.append('%s: action must have an id: %r.' %
+                              (where, act))
+                continue
+            if act['id'] in action_ids:
+                errors.append('%s: id %s already used.' % (where, act['id']))
+            action_ids.add(act['id'])
+            if act.get('timeout') is not None:
+                try:
+                    if float(act['timeout']) <= 0:
+                        raise ValueError()
+                except (TypeError, ValueError):
+                    errors.append('%s/%s: timeout must be a number of '
+                                  'seconds.' % (where, act['id']))
+            _check_commands(act.get('commands', []),
+                            '%s/%s' % (where, act['id']), errors)
+
+
+def validate(menus):
+    """Returns a list of the ways the answer file schema does not match the
+    layout expected, empty if it does.
+    """
+    errors = []
+    has_prepare_menu = False
+    # [{ ... }]
+    for menu_name, groups in _get_items(menus, 'Schema', errors):
+        if menu_name == settings.PREPARE_MENU:
+            has_prepare_menu = True
+            _check_prepare_menu(groups, errors)
+        else:
+            _check_menu(menu_name, groups, errors)
+    if not has_prepare_menu:
+        errors.append('No %s menu.' % settings.PREPARE_MENU)
+    return errors
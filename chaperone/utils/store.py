@@ -0,0 +1,96 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Content addressed file store. Each distinct content is kept once, named by
+# its SHA-256 digest, and files are hard links to it, so saving the same
+# content again under any name costs no more space.
+
+import hashlib
+import logging
+import os
+import tempfile
+import uuid
+
+
+LOG = logging.getLogger(__name__)
+
+
+def _link(src, dst):
+    # Replace dst with a hard link to src, so it is never missing or partly
+    # written.
+    dirname, basename = os.path.split(os.path.abspath(dst))
+    tmpname = os.path.join(dirname, '.%s.%s' % (basename, uuid.uuid4().hex))
+    os.link(src, tmpname)
+    try:
+        os.rename(tmpname, dst)
+    except:
+        os.remove(tmpname)
+        raise
+
+
+def _remove_unlinked(path):
+    # Remove stored content that no file links to any more.
+    try:
+        if os.stat(path).st_nlink == 1:
+            os.remove(path)
+            LOG.debug('Removed unused content %s' % path)
+    except OSError:
+        pass
+
+
+def save(chunks, store_dir, filename, previous_digest=None):
+    """Saves the content, given as an iterable of strings, to the store and
+    links filename to it. Returns (digest, size, changed), where changed is
+    False if filename already had the same content.
+
+    Content that filename had before, with previous_digest, is removed from
+    the store if no other file links to it.
+    """
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+
+    # Hash while writing, so the content is only read once.
+    sha = hashlib.sha256()
+    size = 0
+    fd, tmpname = tempfile.mkstemp(prefix='.upload.', dir=store_dir)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            for chunk in chunks:
+                sha.update(chunk)
+                size += len(chunk)
+                fp.write(chunk)
+        digest = sha.hexdigest()
+        path = os.path.join(store_dir, digest)
+        if os.path.exists(path):
+            # Already have this content.
+            os.remove(tmpname)
+        else:
+            os.chmod(tmpname, 0o644)
+            os.rename(tmpname, path)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+    if os.path.exists(filename) and os.path.samefile(filename, path):
+        LOG.debug('%s unchanged' % filename)
+        return digest, size, False
+
+    _link(path, filename)
+    LOG.debug('%s linked to %s' % (filename, path))
+    if previous_digest and previous_digest != digest:
+        _remove_unlinked(os.path.join(store_dir, previous_digest))
+    return digest, size, True
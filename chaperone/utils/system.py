@@ -0,0 +1,60 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Files and processes, as looked after by more than one part of Chaperone.
+
+import errno
+import os
+import shutil
+import tempfile
+
+
+def write_atomic(fname, data):
+    """Writes data to a temporary file that then replaces the file, so
+    readers never see it partly written.
+    """
+    dirname, basename = os.path.split(os.path.abspath(fname))
+    fd, tmpname = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        if os.path.exists(fname):
+            shutil.copymode(fname, tmpname)
+        else:
+            os.chmod(tmpname, 0o644)
+        os.rename(tmpname, fname)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+def is_running(pid):
+    """Returns True if the process exists and has not exited."""
+    try:
+        os.kill(pid, 0)
+    except OSError, err:
+        if err.errno != errno.EPERM:
+            return False
+    try:
+        with open('/proc/%d/stat' % pid, 'r') as fp:
+            # State follows the command name, which is in parentheses.
+            state = fp.read().rsplit(')', 1)[1].split()[0]
+    except (IOError, IndexError):
+        return True
+    return state not in ('Z', 'X')
@@ -0,0 +1,144 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Run slow calls, like vCenter queries, at the same time, each on a thread of
+# its own, with a bound on how many run at once in the process.
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+LOG = logging.getLogger(__name__)
+
+# Most calls run at once.
+POOL_SIZE = getattr(settings, 'VCENTER_DISCOVERY_THREADS', 4)
+# Seconds to wait for each call to finish.
+TIMEOUT = getattr(settings, 'VCENTER_DISCOVERY_TIMEOUT', 120)
+
+# Call states.
+WAITING = 'waiting'
+RUNNING = 'running'
+FINISHED = 'finished'
+# Taken too long, so no longer waited for, or counted as running.
+GIVEN_UP = 'given up'
+
+_lock = threading.Lock()
+# Calls running in this process, started over in processes forked from it,
+# which don't have the threads running them.
+_slots = {'pid': None, 'condition': None, 'running': 0}
+
+
+def _get_slots():
+    with _lock:
+        if _slots['pid'] != os.getpid():
+            _slots['pid'] = os.getpid()
+            _slots['condition'] = threading.Condition()
+            _slots['running'] = 0
+        return _slots
+
+
+class _Call(object):
+    # A call run on a daemon thread of its own, once fewer than POOL_SIZE
+    # others are running.
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self._slots = _get_slots()
+        self._state = WAITING
+
+    def start(self):
+        thread = threading.Thread(target=self._run,
+                                  name='task-%s' % self.fn.__name__)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        slots = self._slots
+        with slots['condition']:
+            while self._state == WAITING and slots['running'] >= POOL_SIZE:
+                slots['condition'].wait()
+            if self._state != WAITING:
+                # Given up on before its turn came.
+                return
+            self._state = RUNNING
+            slots['running'] += 1
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except Exception, e:
+            LOG.exception('%s failed' % self.fn.__name__)
+            self.error = str(e) or e.__class__.__name__
+        finally:
+            self._leave(FINISHED)
+            self.done.set()
+
+    def _leave(self, state):
+        # Let the next waiting call run, if this one was running. Return
+        # False if it had already finished, or been given up on.
+        slots = self._slots
+        with slots['condition']:
+            if self._state == RUNNING:
+                slots['running'] -= 1
+            if self._state not in (WAITING, RUNNING):
+                return False
+            self._state = state
+            slots['condition'].notify_all()
+            return True
+
+    def give_up(self):
+        """Stops waiting for the call, which finishes in the background if
+        already running, without holding up other calls. Returns False if it
+        has just finished after all.
+        """
+        return self._leave(GIVEN_UP)
+
+
+def run_all(calls, timeout=None):
+    """Runs the calls at the same time, and returns a list of (result, error)
+    for each, in the same order. 'calls' is a list of (function, args,
+    kwargs).
+
+    The error is None if the call returned, or a message saying why it did
+    not. A call that takes longer than timeout seconds is given up on, though
+    it is left to finish in the background, no longer counted against the
+    calls that may run at once.
+    """
+    if timeout is None:
+        timeout = TIMEOUT
+    deadline = time.time() + timeout
+    pending = [_Call(fn, args, kwargs) for fn, args, kwargs in calls]
+    for call in pending:
+        call.start()
+
+    results = []
+    for call in pending:
+        if (call.done.wait(max(deadline - time.time(), 0)) or
+                not call.give_up()):
+            call.done.wait()
+            results.append((call.result, call.error))
+        else:
+            LOG.error('%s timed out after %s seconds' %
+                      (call.fn.__name__, timeout))
+            results.append((None, 'timed out'))
+    return results
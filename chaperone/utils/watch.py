@@ -0,0 +1,156 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+"""
+Wait for files to change.
+
+Uses inotify, through ctypes, so that waiting wakes up as soon as a file is
+written to. Where inotify is not available, the files are checked with stat()
+at a short interval instead.
+"""
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import sys
+import time
+
+LOG = logging.getLogger(__name__)
+
+# From <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE)
+EVENT_HEADER = struct.Struct('iIII')
+
+# Seconds between checks when inotify is not available.
+POLL_INTERVAL = 0.5
+
+try:
+    LIBC = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    LIBC.inotify_init1
+    LIBC.inotify_add_watch
+except (OSError, AttributeError):
+    LIBC = None
+
+
+class FileWatcher(object):
+    """Waits for any of the given files to be created, written to, replaced
+    or removed.
+
+    The files do not need to exist yet. Their directories are watched, rather
+    than the files themselves, so files that get replaced are still followed.
+    """
+
+    def __init__(self, filenames):
+        self.filenames = [os.path.abspath(f) for f in filenames]
+        self.fd = None
+        self.watches = {}
+        if LIBC is not None:
+            self._add_watches()
+        self.stats = self._get_stats()
+
+    def _add_watches(self):
+        fd = LIBC.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            LOG.debug('inotify not available: %s' %
+                      os.strerror(ctypes.get_errno()))
+            return
+        for filename in self.filenames:
+            if isinstance(filename, unicode):
+                filename = filename.encode(sys.getfilesystemencoding())
+            dirname, basename = os.path.split(filename)
+            wd = LIBC.inotify_add_watch(fd, dirname, WATCH_MASK)
+            if wd < 0:
+                LOG.debug('Cannot watch %s: %s' %
+                          (dirname, os.strerror(ctypes.get_errno())))
+                os.close(fd)
+                self.watches = {}
+                return
+            self.watches.setdefault(wd, set()).add(basename)
+        self.fd = fd
+
+    def _get_stats(self):
+        stats = []
+        for filename in self.filenames:
+            try:
+                st = os.stat(filename)
+                stats.append((st.st_ino, st.st_mtime, st.st_size))
+            except OSError:
+                stats.append(None)
+        return stats
+
+    def _read_events(self):
+        # Return True if any of the events read are for the watched files.
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 4096)
+            except OSError, err:
+                if err.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+            if not data:
+                break
+            pos = 0
+            while pos + EVENT_HEADER.size <= len(data):
+                wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, pos)
+                pos += EVENT_HEADER.size
+                name = data[pos:pos + length].rstrip('\0')
+                pos += length
+                if name in self.watches.get(wd, ()):
+                    changed = True
+        return changed
+
+    def wait(self, timeout):
+        """Wait up to timeout seconds for a file to change. Returns True if one
+        did.
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self.fd is not None:
+                try:
+                    ready = select.select([self.fd], [], [], remaining)[0]
+                except select.error, err:
+                    if err.args[0] == errno.EINTR:
+                        continue
+                    raise
+                if ready and self._read_events():
+                    return True
+            else:
+                time.sleep(min(POLL_INTERVAL, remaining))
+                stats = self._get_stats()
+                if stats != self.stats:
+                    self.stats = stats
+                    return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
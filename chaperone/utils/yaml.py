@@ -15,16 +15,57 @@
 #
 from __future__ import absolute_import
 
+import copy
+import errno
 import fcntl
+import hashlib
 import logging
+import marshal
 import os
 import sys
+import threading
 import yaml
 
 from django.conf import settings
 
+from chaperone.utils import metrics, system
+
 LOG = logging.getLogger(__name__)
 
+# Parsed YAML content keyed by file name, as (dependencies, content). The
+# dependencies are the (path, mtime, size) of the file and of every file it
+# included, so the content is only reused while none of them have changed.
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Dependencies of the files currently being loaded in this thread, innermost
+# last, so that included files are recorded against the file including them.
+_loading = threading.local()
+
+# Compiled content is written next to the YAML file it was compiled from, in
+# this format.
+COMPILED_SUFFIX = '.compiled'
+COMPILED_FORMAT = 2
+
+
+def _stat(fname):
+    # Return (path, mtime, size) for the file, or (path, None, None) if it
+    # does not exist, so that creating it is noticed too.
+    try:
+        st = os.stat(fname)
+    except OSError:
+        return (fname, None, None)
+    return (fname, st.st_mtime, st.st_size)
+
+
+def _is_current(dependencies):
+    # Return True if none of the files have changed since they were loaded.
+    for dependency in dependencies:
+        if _stat(dependency[0]) != dependency:
+            return False
+    return True
+
+
 def include_constructor(loader, node):
     """Loads a yaml include file."""
     LOG.debug("Loading YAML(include) content from %s." % node.value)
@@ -35,31 +76,266 @@ def include_constructor(loader, node):
         LOG.debug("Cannot load YAML(include) content from %s because: %s." % (node.value, os.strerror(err.errno)))
     return content
 
-def load(fname, inhibit_constructor=False):
-    """Loads a yaml file, though with Chaperone extensions, like include files."""
+def _unicode_constructor(loader, node):
+    # Strings dumped as unicode before only safe types were written.
+    return loader.construct_scalar(node)
+
+# String types, like those of Django form data, that files written before
+# only safe types were written may hold as Python objects.
+LEGACY_STRING_TYPES = (
+    'django.utils.safestring.SafeText',
+    'django.utils.safestring.SafeUnicode',
+    'django.utils.safestring.SafeBytes',
+    'django.utils.safestring.SafeString',
+)
+
+def _legacy_string_constructor(loader, suffix, node):
+    # Return a string saved as one of LEGACY_STRING_TYPES, as a plain string.
+    if suffix not in LEGACY_STRING_TYPES:
+        raise yaml.constructor.ConstructorError(
+            None, None, 'cannot load Python object %s' % suffix,
+            node.start_mark)
+    if isinstance(node, yaml.MappingNode):
+        args = loader.construct_mapping(node, deep=True).get('args', [])
+    else:
+        args = loader.construct_sequence(node, deep=True)
+    return args[0] if args else u''
+
+SafeConstructor = yaml.constructor.SafeConstructor
+
+# Other tags for plain values that files written before only safe types were
+# written may have.
+LEGACY_CONSTRUCTORS = {
+    u'tag:yaml.org,2002:python/unicode': _unicode_constructor,
+    u'tag:yaml.org,2002:python/str': _unicode_constructor,
+    u'tag:yaml.org,2002:python/none': SafeConstructor.construct_yaml_null,
+    u'tag:yaml.org,2002:python/bool': SafeConstructor.construct_yaml_bool,
+    u'tag:yaml.org,2002:python/int': SafeConstructor.construct_yaml_int,
+    u'tag:yaml.org,2002:python/long': SafeConstructor.construct_yaml_int,
+    u'tag:yaml.org,2002:python/float': SafeConstructor.construct_yaml_float,
+    u'tag:yaml.org,2002:python/complex':
+        lambda loader, node: complex(loader.construct_scalar(node)),
+    u'tag:yaml.org,2002:python/tuple':
+        lambda loader, node: tuple(loader.construct_sequence(node)),
+}
+
+def _make_loader(base):
+    # Return a loader class based on the given one, with Chaperone extensions.
+    loader = type('Chaperone%s' % base.__name__, (base,), {})
+    loader.add_constructor('!include', include_constructor)
+    for tag, constructor in LEGACY_CONSTRUCTORS.items():
+        loader.add_constructor(tag, constructor)
+    loader.add_multi_constructor(u'tag:yaml.org,2002:python/object/new:',
+                                 _legacy_string_constructor)
+    return loader
+
+def _make_dumper(base):
+    # Return a dumper class based on the given one, that writes subclasses of
+    # strings, like Django's SafeText, as plain strings.
+    dumper = type('Chaperone%s' % base.__name__, (base,), {})
+    dumper.add_multi_representer(
+        unicode, lambda dumper, data: dumper.represent_unicode(unicode(data)))
+    dumper.add_multi_representer(
+        str, lambda dumper, data: dumper.represent_str(str(data)))
+    return dumper
+
+# Pure Python loader and dumper, and the libyaml based ones, which are many
+# times faster, if PyYAML was built with them.
+PURE_LOADER = _make_loader(yaml.SafeLoader)
+PURE_DUMPER = _make_dumper(yaml.SafeDumper)
+HAS_LIBYAML = hasattr(yaml, 'CSafeLoader')
+if HAS_LIBYAML:
+    LOADER = _make_loader(yaml.CSafeLoader)
+    DUMPER = _make_dumper(yaml.CSafeDumper)
+else:
+    LOADER = PURE_LOADER
+    DUMPER = PURE_DUMPER
+
+def loads(text, loader=None):
+    """Parses yaml text, with Chaperone extensions."""
+    return yaml.load(text, Loader=loader or LOADER)
+
+def dumps(content, dumper=None):
+    """Returns object as yaml text."""
+    return yaml.dump(content, Dumper=dumper or DUMPER,
+                     default_flow_style=False)
+
+def _parse(fname):
+    # Read and parse the file, returning the files it depends on and the
+    # parsed content.
+    dependencies = []
+    stack = getattr(_loading, 'stack', None)
+    if stack is None:
+        stack = _loading.stack = []
+    stack.append(dependencies)
     content = None
     try:
-        yaml.add_constructor("!include", include_constructor)
         LOG.debug("Loading YAML content from %s." % fname)
         with open(fname, 'r') as fp:
             fcntl.flock(fp, fcntl.LOCK_SH)
+            st = os.fstat(fp.fileno())
             file_contents = fp.read()
             fcntl.flock(fp, fcntl.LOCK_UN)
-        content = yaml.load(file_contents)
+        dependencies.insert(0, (fname, st.st_mtime, st.st_size))
+        with metrics.timer('chaperone_yaml_seconds', operation='parse',
+                           file=os.path.basename(fname)):
+            content = loads(file_contents)
         LOG.debug(" ==> YAML content from %s.\n\t%s" % (fname, str(content)))
     except IOError, err:
         LOG.debug("Cannot load YAML content from %s because: %s." % (fname, os.strerror(err.errno)))
+        dependencies.insert(0, _stat(fname))
+    finally:
+        stack.pop()
 
     if content == None:
         content = {}
 
-    return content
+    return dependencies, content
+
+def _hash_file(fname):
+    with open(fname, 'rb') as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+def _load_compiled(fname):
+    # Return (dependencies, content) from the file's compiled content, or None
+    # if there is none, or any file it was compiled from has changed.
+    compiled = fname + COMPILED_SUFFIX
+    try:
+        with open(compiled, 'rb') as fp:
+            st = os.fstat(fp.fileno())
+            data = marshal.load(fp)
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(data, dict) or data.get('format') != COMPILED_FORMAT:
+        return None
+
+    dependencies = []
+    for path, mtime, size, digest in data['sources']:
+        dependency = _stat(path)
+        if digest is None:
+            # Was missing when compiled.
+            if dependency[1] is not None:
+                return None
+        elif dependency[1:] != (mtime, size):
+            # Only hashed when touched, as hashing costs about as much as
+            # parsing.
+            try:
+                if _hash_file(path) != digest:
+                    return None
+            except IOError:
+                return None
+        dependencies.append(dependency)
+    dependencies.append((compiled, st.st_mtime, st.st_size))
+    LOG.debug("Using compiled YAML content %s." % compiled)
+    return dependencies, data['content']
+
+def _get_entry(fname):
+    # Return (dependencies, content) for the file, parsing it only if it or
+    # a file it includes has changed, and it has no up to date compiled
+    # content.
+    entry = _cache.get(fname)
+    if entry and _is_current(entry[0]):
+        LOG.debug("Using cached YAML content for %s." % fname)
+        return entry
+    entry = _load_compiled(fname) or _parse(fname)
+    with _cache_lock:
+        _cache[fname] = entry
+    return entry
+
+def load(fname, inhibit_constructor=False):
+    """Loads a yaml file, though with Chaperone extensions, like include files.
+
+    Parsed content is cached for the life of the process, and only parsed
+    again when the file or any file it includes has changed.
+    """
+    with metrics.timer('chaperone_yaml_seconds', operation='load',
+                       file=os.path.basename(fname)):
+        return _load(fname)
+
+def _load(fname):
+    # Return a copy of the file's content, noting the files it depends on
+    # for whatever file is including it.
+    dependencies, content = _get_entry(fname)
+
+    # Changes to this file also invalidate whatever file included it.
+    stack = getattr(_loading, 'stack', None)
+    if stack:
+        stack[-1].extend(dependencies)
 
-def dump(fname, content):
-    """ save object as yaml to a file."""
+    # Callers are free to modify what they get back.
+    return copy.deepcopy(content)
+
+def version(fname):
+    """Returns a string that changes whenever the file, or any file it
+    includes, changes.
+    """
+    dependencies = _get_entry(fname)[0]
+    return hashlib.sha1(repr(dependencies)).hexdigest()
+
+def dump(fname, content, atomic=False):
+    """ save object as yaml to a file.
+
+    If atomic is set, the content is written to a temporary file that then
+    replaces the file, so readers never see it partly written.
+    """
     LOG.debug("YAML dumping content: %s\n" % str(content))
-    with open(fname, 'w+') as fp:
-        fcntl.flock(fp, fcntl.LOCK_EX)
-        fp.write(yaml.dump(content, default_flow_style=False))
-        fcntl.flock(fp, fcntl.LOCK_UN)
-        LOG.debug('YAML content file %s written' % fname)
+    with metrics.timer('chaperone_yaml_seconds', operation='dump',
+                       file=os.path.basename(fname)):
+        _dump(fname, content, atomic)
+
+def _dump(fname, content, atomic):
+    # Write the content to the file, and forget what was parsed from it.
+    if atomic:
+        system.write_atomic(fname, dumps(content))
+        LOG.debug('YAML content file %s replaced' % fname)
+    else:
+        with open(fname, 'w+') as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            fp.write(dumps(content))
+            fcntl.flock(fp, fcntl.LOCK_UN)
+            LOG.debug('YAML content file %s written' % fname)
+    with _cache_lock:
+        _cache.pop(fname, None)
+
+def compile_file(fname):
+    """Writes the content of a yaml file, with includes resolved, to a
+    compiled file next to it, and returns the content, or None if the content
+    can't be compiled.
+
+    load() uses the compiled content instead of parsing the file for as long
+    as the file and every file it included are unchanged, going by their
+    modification times and sizes, or their hashes if those differ. Content
+    with values marshal can't save, like dates, is left to be parsed each
+    time.
+    """
+    if not os.path.exists(fname):
+        raise IOError(errno.ENOENT, os.strerror(errno.ENOENT), fname)
+    dependencies, content = _parse(fname)
+    sources = []
+    for path, mtime, size in dependencies:
+        if path.endswith(COMPILED_SUFFIX):
+            # An included file's own compiled content.
+            continue
+        if mtime is None:
+            sources.append((path, None, None, None))
+        else:
+            sources.append((path, mtime, size, _hash_file(path)))
+
+    compiled = fname + COMPILED_SUFFIX
+    try:
+        data = marshal.dumps({
+            'format': COMPILED_FORMAT,
+            'sources': sources,
+            'content': content,
+        })
+    except ValueError, e:
+        LOG.warn('Not compiling YAML content %s: %s' % (fname, e))
+        # Any compiled content left from before is out of date.
+        if os.path.exists(compiled):
+            os.remove(compiled)
+        return None
+    system.write_atomic(compiled, data)
+    LOG.info('Compiled YAML content %s written' % compiled)
+    with _cache_lock:
+        _cache.pop(fname, None)
+    return content
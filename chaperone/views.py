@@ -13,6 +13,7 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import datetime
 import fcntl
 import json
 import logging
@@ -20,27 +21,28 @@ import os
 
 from django.conf import settings
 from django.contrib import auth
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import render, redirect
+from django.utils.crypto import constant_time_compare
 
 from prepare.views import write_answer_file
 from chaperone.forms import VCenterForm
-from chaperone.utils import getters, yaml
+from chaperone.utils import getters, inventory, metrics, yaml
 
 LOG = logging.getLogger(__name__)
 
-MIN_MGMT_NETWORKS = 1
-
 
 def index(request):
     """Main page, where the magic happens."""
     filename = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
     menus = yaml.load(filename)
 
-    return render(request, 'chaperone/index.html', {
-        'menus': menus,
-        'application_full_name': settings.APP_FULLNAME,
-    })
+    with metrics.timer('chaperone_template_render_seconds',
+                       template='chaperone/index.html'):
+        return render(request, 'chaperone/index.html', {
+            'menus': menus,
+            'application_full_name': settings.APP_FULLNAME,
+        })
 
 
 def login(request):
@@ -66,13 +68,15 @@ def login(request):
             LOG.info('User %s made failed login attempt' % username)
             error_message = 'Invalid username or password.'
 
-    return render(request, 'chaperone/login.html', {
-        'error_message': error_message,
-        'next_url': request.GET.get('next', '/'),
-        'username': username,
-        'application_full_name': settings.APP_FULLNAME,
-        'application_short_name': settings.APP_SHORTNAME,
-    })
+    with metrics.timer('chaperone_template_render_seconds',
+                       template='chaperone/login.html'):
+        return render(request, 'chaperone/login.html', {
+            'error_message': error_message,
+            'next_url': request.GET.get('next', '/'),
+            'username': username,
+            'application_full_name': settings.APP_FULLNAME,
+            'application_short_name': settings.APP_SHORTNAME,
+        })
 
 
 def logout(request):
@@ -87,27 +91,18 @@ def logout(request):
 def list_options(request):
     """Get options for a given field."""
     field_id = request.REQUEST.get('fid')
-    fn_name = 'get_%s' % field_id
-    fn = getattr(getters, fn_name)
-
-    kwargs = {
-        'vcenter': request.REQUEST.get('vcenter'),
-        'username': request.REQUEST.get('username'),
-        'password': request.REQUEST.get('password')
-    }
-    datacenter = request.REQUEST.get('datacenter')
-    if datacenter is not None:
-        kwargs['datacenter'] = datacenter
-    cluster = request.REQUEST.get('cluster')
-    if cluster is not None:
-        kwargs['cluster'] = cluster
-    options = fn(**kwargs)
+    opt_names, age = inventory.get_field_options(
+        field_id, request.REQUEST.get('vcenter'),
+        request.REQUEST.get('username'), request.REQUEST.get('password'),
+        datacenter=request.REQUEST.get('datacenter'),
+        cluster=request.REQUEST.get('cluster'))
 
     data = {}
-    if options is not None:
-        opt_names = options.keys()
-        opt_names.sort()
+    if opt_names is not None:
         data['options'] = opt_names
+        # Note if these came from the cache, and how old they are.
+        data['cached'] = age is not None
+        data['age'] = int(age or 0)
     else:
         data['errors'] = ['Invalid username or password.']
     return HttpResponse(json.dumps(data), content_type='application/json')
@@ -130,12 +125,20 @@ def vcenter_settings(request):
             missing_values = True
             break
 
-    return render(request, 'chaperone/vcenter.html', {
-        'menus': menus,
-        'vcenter_form': vcenter_form,
-        'missing_values': missing_values,
-        'application_full_name': settings.APP_FULLNAME,
-    })
+    # When refresh_inventory, or the last save, rebuilt the options.
+    options_refreshed = inventory.get_options_refreshed_time()
+    if options_refreshed is not None:
+        options_refreshed = datetime.datetime.fromtimestamp(options_refreshed)
+
+    with metrics.timer('chaperone_template_render_seconds',
+                       template='chaperone/vcenter.html'):
+        return render(request, 'chaperone/vcenter.html', {
+            'menus': menus,
+            'vcenter_form': vcenter_form,
+            'missing_values': missing_values,
+            'options_refreshed': options_refreshed,
+            'application_full_name': settings.APP_FULLNAME,
+        })
 
 
 def save_vcenter(request):
@@ -147,8 +150,6 @@ def save_vcenter(request):
     data = {}
 
     if form and form.is_valid():
-        errors = []
-
         comp_vc = str(form.cleaned_data[getters.COMP_VC])
         comp_vc_username = str(form.cleaned_data[getters.COMP_VC_USERNAME])
         comp_vc_password = str(form.cleaned_data[getters.COMP_VC_PASSWORD])
@@ -177,129 +178,15 @@ def save_vcenter(request):
         # Save vCenter settings to file.
         yaml.dump(settings.VCENTER_SETTINGS, vcenter_data)
 
-        options_data = {
-            getters.COMP_VC: [comp_vc],
-            getters.COMP_VC_USERNAME: [comp_vc_username],
-            getters.COMP_VC_PASSWORD: [comp_vc_password],
-            getters.MGMT_VC: [mgmt_vc],
-            getters.MGMT_VC_USERNAME: [mgmt_vc_username],
-            getters.MGMT_VC_PASSWORD: [mgmt_vc_password],
-        }
-
-        # Get management datacenters.
-        mgmt_vc_datacenters = getters.get_mgmt_vc_datacenter(
-            vcenter=mgmt_vc, username=mgmt_vc_username,
-            password=mgmt_vc_password, datacenter='')
-        if not mgmt_vc_datacenters:
-            errors.append('No management vCenter datacenters found.')
-        else:
-            options_data[getters.MGMT_VC_DATACENTER] = (
-                mgmt_vc_datacenters.keys())
-
-        # Get clusters in the management datacenters.
-        mgmt_vc_clusters = None
-        if mgmt_vc_datacenters:
-            mgmt_vc_clusters = getters.get_mgmt_vc_cluster(
-                vcenter=mgmt_vc, username=mgmt_vc_username,
-                password=mgmt_vc_password, datacenter=mgmt_vc_datacenter,
-                cluster='')
-            if not mgmt_vc_clusters:
-                errors.append('No management vCenter clusters found.')
-            else:
-                options_data[getters.MGMT_VC_CLUSTER] = mgmt_vc_clusters.keys()
-
-        if mgmt_vc_clusters:
-            # Get hosts in these clusters.
-            mgmt_vc_hosts = getters.get_mgmt_vc_hosts(
-                vcenter=mgmt_vc, username=mgmt_vc_username,
-                password=mgmt_vc_password, datacenter=mgmt_vc_datacenter,
-                cluster=mgmt_vc_cluster)
-            if not mgmt_vc_hosts:
-                errors.append('No management vCenter hosts found.')
-            else:
-                options_data[getters.MGMT_VC_HOSTS] = mgmt_vc_hosts.keys()
-
-            # Get datastores in these clusters.
-            mgmt_vc_datastores = getters.get_mgmt_vc_datastores(
-                vcenter=mgmt_vc, username=mgmt_vc_username,
-                password=mgmt_vc_password, datacenter=mgmt_vc_datacenter,
-                cluster=mgmt_vc_cluster)
-            if not mgmt_vc_datastores:
-                errors.append('No management vCenter datastores found.')
-            else:
-                options_data[getters.MGMT_VC_DATASTORES] = mgmt_vc_datastores.keys()
-
-            # Get networks in these clusters.
-            mgmt_vc_networks = getters.get_mgmt_vc_networks(
-                vcenter=mgmt_vc, username=mgmt_vc_username,
-                password=mgmt_vc_password, datacenter=mgmt_vc_datacenter,
-                cluster=mgmt_vc_cluster)
-            if (not mgmt_vc_networks or
-                    len(mgmt_vc_networks) < MIN_MGMT_NETWORKS):
-                errors.append(
-                    'At least %s management vCenter network%s must be '
-                    'available.' % (MIN_MGMT_NETWORKS,
-                                    '' if MIN_MGMT_NETWORKS == 1 else 's'))
-            else:
-                options_data[getters.MGMT_VC_NETWORKS] = mgmt_vc_networks.keys()
-
-        # Get compute datacenters.
-        comp_vc_datacenters = getters.get_comp_vc_datacenter(
-            vcenter=comp_vc, username=comp_vc_username,
-            password=comp_vc_password, datacenter='')
-        if not comp_vc_datacenters:
-            errors.append('No compute vCenter datacenters found.')
-        else:
-            options_data[getters.COMP_VC_DATACENTER] = (
-                comp_vc_datacenters.keys())
-
-        # Get clusters in the compute datacenters.
-        comp_vc_clusters = None
-        if comp_vc_datacenters:
-            comp_vc_clusters = getters.get_comp_vc_cluster(
-                vcenter=comp_vc, username=comp_vc_username,
-                password=comp_vc_password, datacenter=comp_vc_datacenter,
-                cluster='')
-            if not comp_vc_clusters:
-                errors.append('No compute vCenter clusters found.')
-            else:
-                options_data[getters.COMP_VC_CLUSTER] = comp_vc_clusters.keys()
-
-        if comp_vc_clusters:
-            # Get hosts in these clusters.
-            comp_vc_hosts = getters.get_comp_vc_hosts(
-                vcenter=comp_vc, username=comp_vc_username,
-                password=comp_vc_password, datacenter=comp_vc_datacenter,
-                cluster=comp_vc_cluster)
-            if not comp_vc_hosts:
-                errors.append('No compute vCenter hosts found.')
-            else:
-                options_data[getters.COMP_VC_HOSTS] = comp_vc_hosts.keys()
-
-            # Get datastores in these clusters.
-            comp_vc_datastores = getters.get_comp_vc_datastores(
-                vcenter=comp_vc, username=comp_vc_username,
-                password=comp_vc_password, datacenter=comp_vc_datacenter,
-                cluster=comp_vc_cluster)
-            if not comp_vc_datastores:
-                errors.append('No compute vCenter datastores found.')
-            else:
-                options_data[getters.COMP_VC_DATASTORES] = comp_vc_datastores.keys()
-
-            # Get networks in these clusters.
-            comp_vc_networks = getters.get_comp_vc_networks(
-                vcenter=comp_vc, username=comp_vc_username,
-                password=comp_vc_password, datacenter=comp_vc_datacenter,
-                cluster=comp_vc_cluster)
-            options_data[getters.COMP_VC_NETWORKS] = comp_vc_networks.keys()
+        # Get options for the vCenter fields.
+        options_data, errors = inventory.get_options(vcenter_data)
 
         if errors:
             LOG.error('Unable to save vCenter settings: %s' % errors)
             data['errors'] = errors
         else:
             # Save vCenter field options to file.
-            options_filename = settings.INPUT_OPTIONS
-            yaml.dump(options_filename, options_data)
+            inventory.save_options(options_data)
 
             # Rewrite the answer file, to update with new vCenter values and
             # check if previously saved values for dynamically populated fields
@@ -358,3 +245,20 @@ def save_vcenter(request):
             LOG.error('Unable to save vCenter settings: no vCenter form exists!')
             data['field_errors'] = 'No form was created'
     return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def export_metrics(request):
+    """Request counts and timings of all web server processes, for
+    Prometheus to scrape with the CHAPERONE_METRICS_TOKEN bearer token. No
+    one can get them until the token is set.
+    """
+    token = getattr(settings, 'CHAPERONE_METRICS_TOKEN', None)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if (not token or
+            not constant_time_compare(authorization, 'Bearer %s' % token)):
+        return HttpResponseForbidden()
+    allowed = getattr(settings, 'CHAPERONE_METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(),
+                        content_type='text/plain; version=0.0.4')
@@ -29,4 +29,36 @@ from django.core.wsgi import get_wsgi_application
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../..'))
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "chaperone.local_settings")
 
-application = get_wsgi_application()
+django_application = get_wsgi_application()
+
+# Bytes the server reads at a time from files it sends, if not sending them
+# with sendfile().
+FILE_BLOCK_SIZE = 64 * 1024
+
+
+class _ResponseFile(object):
+    # File of a response for the server to send, which ends the response,
+    # and closes the file, when the server closes it.
+
+    def __init__(self, response):
+        self._response = response
+        self._fp = response.file_to_stream
+
+    def read(self, *args):
+        return self._fp.read(*args)
+
+    def fileno(self):
+        return self._fp.fileno()
+
+    def close(self):
+        self._response.close()
+
+
+def application(environ, start_response):
+    response = django_application(environ, start_response)
+    if (getattr(response, 'file_to_stream', None) is not None and
+            'wsgi.file_wrapper' in environ):
+        # Let the server send the file without passing it through Python.
+        return environ['wsgi.file_wrapper'](_ResponseFile(response),
+                                            FILE_BLOCK_SIZE)
+    return response
@@ -0,0 +1,188 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# History of execute runs, and of each command in them, kept in SQLite.
+#
+# Kept free of Django, so the job supervisor can record runs as they go.
+
+import json
+import sqlite3
+
+# Seconds to wait for other processes writing to the history.
+BUSY_TIMEOUT = 30
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS runs (
+        id TEXT PRIMARY KEY,
+        menu TEXT,
+        grp TEXT,
+        action TEXT,
+        state TEXT,
+        created REAL,
+        started REAL,
+        finished REAL,
+        wall_time REAL,
+        log TEXT
+    )''',
+    '''CREATE INDEX IF NOT EXISTS runs_group
+        ON runs (menu, grp, created)''',
+    '''CREATE TABLE IF NOT EXISTS commands (
+        run_id TEXT,
+        position INTEGER,
+        command TEXT,
+        arguments TEXT,
+        pid INTEGER,
+        state TEXT,
+        exit_code INTEGER,
+        started REAL,
+        finished REAL,
+        wall_time REAL,
+        log_start INTEGER,
+        log_end INTEGER,
+        PRIMARY KEY (run_id, position)
+    )''',
+]
+
+# Resource usage of each command, as reported by wait4(2). CPU times are in
+# seconds, max_rss in KiB, and block I/O in 512 byte blocks.
+USAGE_COLUMNS = ('user_time', 'system_time', 'max_rss', 'block_in',
+                 'block_out', 'voluntary_switches', 'involuntary_switches')
+# Totals for the run.
+RUN_USAGE_COLUMNS = ('user_time', 'system_time', 'max_rss')
+
+RUN_COLUMNS = ('id', 'menu', 'grp', 'action', 'state', 'created', 'started',
+               'finished', 'wall_time', 'log') + RUN_USAGE_COLUMNS
+COMMAND_COLUMNS = ('run_id', 'position', 'command', 'arguments', 'pid',
+                   'state', 'exit_code', 'started', 'finished', 'wall_time',
+                   'log_start', 'log_end') + USAGE_COLUMNS
+# Columns added since the first version of the tables, with their types,
+# which are added to tables that lack them.
+ADDED_COLUMNS = {
+    'runs': [('user_time', 'REAL'), ('system_time', 'REAL'),
+             ('max_rss', 'INTEGER')],
+    'commands': [('user_time', 'REAL'), ('system_time', 'REAL'),
+                 ('max_rss', 'INTEGER'), ('block_in', 'INTEGER'),
+                 ('block_out', 'INTEGER'),
+                 ('voluntary_switches', 'INTEGER'),
+                 ('involuntary_switches', 'INTEGER')],
+}
+
+
+def connect(path):
+    """Returns a connection to the history database, creating it if need
+    be.
+    """
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    with conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = set(row['name'] for row in
+                           conn.execute('PRAGMA table_info(%s)' % table))
+            for column, column_type in columns:
+                if column not in existing:
+                    conn.execute('ALTER TABLE %s ADD COLUMN %s %s' %
+                                 (table, column, column_type))
+    return conn
+
+
+def _wall_time(item):
+    if item.get('started') is None or item.get('finished') is None:
+        return None
+    return item['finished'] - item['started']
+
+
+def _replace(conn, table, columns, values):
+    with conn:
+        conn.execute('INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (
+            table, ', '.join(columns), ', '.join('?' * len(columns))),
+            values)
+
+
+def _run_usage(job):
+    # Return total CPU times, and the most memory any one command used.
+    usages = [c['usage'] for c in job['commands'] if c.get('usage')]
+    if not usages:
+        return None, None, None
+    return (sum(u['user_time'] for u in usages),
+            sum(u['system_time'] for u in usages),
+            max(u['max_rss'] for u in usages))
+
+
+def record_run(conn, job):
+    """Saves the job's run, as it is now."""
+    _replace(conn, 'runs', RUN_COLUMNS, (
+        job['id'], job['menu'], job['group'], job['action'], job['state'],
+        job['created'], job['started'], job['finished'], _wall_time(job),
+        job.get('run_log')) + _run_usage(job))
+
+
+def record_command(conn, job, position):
+    """Saves the command at the given position in the job, as it is now."""
+    command = job['commands'][position]
+    usage = command.get('usage') or {}
+    _replace(conn, 'commands', COMMAND_COLUMNS, (
+        job['id'], position, command['command'],
+        json.dumps(command['command'].split()), command['pid'],
+        command['state'], command['exit_code'], command['started'],
+        command['finished'], _wall_time(command), command.get('log_start'),
+        command.get('log_end')) + tuple(usage.get(c) for c in USAGE_COLUMNS))
+
+
+def get_runs(conn, menu=None, group=None, action=None, limit=50):
+    """Returns the latest runs, newest first, optionally only those of the
+    given group or action, each with a list of its commands.
+    """
+    conditions = []
+    params = []
+    for column, value in (('menu', menu), ('grp', group),
+                          ('action', action)):
+        if value:
+            conditions.append('%s = ?' % column)
+            params.append(value)
+    query = 'SELECT * FROM runs'
+    if conditions:
+        query += ' WHERE %s' % ' AND '.join(conditions)
+    query += ' ORDER BY created DESC LIMIT ?'
+    params.append(limit)
+
+    runs = []
+    for row in conn.execute(query, params):
+        run = dict(zip(row.keys(), row))
+        run['group'] = run.pop('grp')
+        run['commands'] = []
+        for command_row in conn.execute(
+                'SELECT * FROM commands WHERE run_id = ? ORDER BY position',
+                (run['id'],)):
+            command = dict(zip(command_row.keys(), command_row))
+            del command['run_id']
+            command['arguments'] = json.loads(command['arguments'] or '[]')
+            run['commands'].append(command)
+        runs.append(run)
+    return runs
+
+
+def delete_old_runs(conn, menu, group, keep):
+    """Deletes all but the latest keep runs of the group, with their
+    commands.
+    """
+    with conn:
+        ids = [(row['id'],) for row in conn.execute(
+            'SELECT id FROM runs WHERE menu = ? AND grp = ? '
+            'ORDER BY created DESC LIMIT -1 OFFSET ?', (menu, group, keep))]
+        conn.executemany('DELETE FROM commands WHERE run_id = ?', ids)
+        conn.executemany('DELETE FROM runs WHERE id = ?', ids)
@@ -0,0 +1,770 @@
+#
+#  Copyright 2015 VMware, Inc.
+#
+#  Licensed under the Apache License, Version 2.0 (the "License");
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#
+#
+# Runs the commands of an execute job in the background, apart from the web
+# server, so they keep going when web workers are recycled. Progress is saved
+# to the job file, which the web server reads to report on the job.
+#
+# Kept free of Django, so it can run on its own:
+#
+#     python supervisor.py <job file> [--group-locked]
+
+import errno
+import fcntl
+import json
+import os
+import select
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+
+# Implicitly relative, as this also runs as a script from its own directory.
+import history
+
+# Job and command states.
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# Command state when a command it depends on did not succeed.
+SKIPPED = 'skipped'
+# Job state reported when its supervisor went away before finishing.
+LOST = 'lost'
+# Job state when asked to stop, and command state of those not started by
+# then.
+CANCELLED = 'cancelled'
+# Job state when stopped for running longer than its timeout.
+TIMED_OUT = 'timed_out'
+
+# Argument telling the supervisor it was handed the group lock, already
+# held, as its standard input.
+GROUP_LOCKED = '--group-locked'
+
+# Most seconds between checks for a free slot to run a job in, in case a
+# supervisor went away without saying its slot is free.
+SLOT_WAIT_TIMEOUT = 10
+# FIFO next to the slot locks, to which a byte is written as each slot is
+# let go, waking a job waiting for one.
+SLOTS_FIFO = 'slots.fifo'
+# Seconds to wait for the last of a finished command's output.
+COPY_TIMEOUT = 1
+# Seconds commands have to exit once asked to stop, before being killed.
+KILL_GRACE = 5
+# Most seconds between checks for being asked to stop while commands run.
+CHECK_INTERVAL = 1
+
+
+class Cancelled(Exception):
+    pass
+
+
+class StartFailed(Exception):
+    pass
+
+
+# Whether the job has been asked to stop, and whether that stops it right
+# away, as it does while waiting to run.
+_cancel = {'requested': False, 'interrupt': True}
+
+
+def get_job_path(job_dir, job_id):
+    return os.path.join(job_dir, '%s.json' % job_id)
+
+
+def load_job(path):
+    """Returns the job saved to the file, or None if there is none."""
+    try:
+        with open(path, 'r') as fp:
+            return json.load(fp)
+    except (IOError, ValueError):
+        return None
+
+
+def save_job(path, job):
+    """Saves the job, replacing the file in one step, so readers never see it
+    partly written.
+    """
+    dirname, basename = os.path.split(os.path.abspath(path))
+    fd, tmpname = tempfile.mkstemp(prefix='.%s.' % basename, dir=dirname)
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            json.dump(job, fp, indent=2, sort_keys=True)
+        os.chmod(tmpname, 0o644)
+        os.rename(tmpname, path)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+def _lock(path, blocking=True):
+    # Return the lock file once holding an exclusive lock on it, or None if
+    # not blocking and another process holds it. The lock is held until the
+    # file is closed, or the process exits.
+    fp = open(path, 'a')
+    try:
+        fcntl.flock(fp, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except IOError, e:
+        fp.close()
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+    return fp
+
+
+def try_lock(path):
+    """Returns the lock file once holding an exclusive lock on it, or None if
+    another process holds it.
+    """
+    return _lock(path, blocking=False)
+
+
+def is_locked(path):
+    """Returns True if a supervisor holds the lock."""
+    fp = try_lock(path)
+    if fp is None:
+        return True
+    fp.close()
+    return False
+
+
+def _get_slots_fifo(slot_locks):
+    return os.path.join(os.path.dirname(slot_locks[0]), SLOTS_FIFO)
+
+
+def _open_slots_fifo(slot_locks):
+    # Return the read end of the slots FIFO, creating it if need be. Also
+    # holds its write end, so reads wait for a byte instead of seeing the
+    # end of the file once no supervisor has it open for writing.
+    path = _get_slots_fifo(slot_locks)
+    try:
+        os.mkfifo(path, 0o600)
+    except OSError, e:
+        if e.errno != errno.EEXIST:
+            raise
+    reader = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    writer = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+    return reader, writer
+
+
+def _take_slot(slot_locks):
+    # Return the lock of a free slot, waiting for one if need be.
+    reader = writer = None
+    try:
+        while True:
+            for path in slot_locks:
+                fp = _lock(path, blocking=False)
+                if fp is not None:
+                    return fp
+            if reader is None:
+                # Opened before trying the slots again, so a slot let go
+                # after they were tried still wakes us.
+                reader, writer = _open_slots_fifo(slot_locks)
+                continue
+            try:
+                if select.select([reader], [], [], SLOT_WAIT_TIMEOUT)[0]:
+                    # Only take one byte, leaving others to wake other jobs.
+                    os.read(reader, 1)
+            except (OSError, select.error), e:
+                if e.args[0] not in (errno.EINTR, errno.EAGAIN):
+                    raise
+    finally:
+        for fd in (reader, writer):
+            if fd is not None:
+                os.close(fd)
+
+
+def _let_slot_go(slot_locks, slot_lock):
+    # Free the slot, waking a job waiting for one, if there is any.
+    slot_lock.close()
+    try:
+        fd = os.open(_get_slots_fifo(slot_locks), os.O_WRONLY | os.O_NONBLOCK)
+    except OSError, e:
+        # No FIFO, or no job waiting to read it.
+        if e.errno not in (errno.ENOENT, errno.ENXIO):
+            raise
+        return
+    try:
+        os.write(fd, '.')
+    except OSError, e:
+        # Full, so waiting jobs already have plenty to wake them.
+        if e.errno != errno.EAGAIN:
+            raise
+    finally:
+        os.close(fd)
+
+
+def new_job(job_dir, menu_name, group_name, action_id, commands, log,
+            run_file, group_lock, slot_locks, history_db, max_parallel=1,
+            timeout=None, keep_runs=None):
+    """Returns a new queued job to run the commands, writing their output
+    to log and their process ids to run_file, and saves it in job_dir.
+
+    Each command is a dict with its id, the command line, the ids of
+    commands it runs after, and the ids of those it depends on, which must
+    succeed for it to run. Up to max_parallel commands whose turn has come
+    run at the same time. Commands still running timeout seconds after the
+    job started are stopped.
+
+    The job waits for group_lock, held while any other job of the group is
+    running, and for one of slot_locks, which cap how many jobs run at once.
+    The run, and how each command did, is recorded in history_db. Once it
+    starts, the job files, logs and history of all but the latest keep_runs
+    runs of the group are deleted, if given keep_runs.
+    """
+    if not os.path.isdir(job_dir):
+        os.makedirs(job_dir)
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'menu': menu_name,
+        'group': group_name,
+        'action': action_id,
+        'state': QUEUED,
+        'created': time.time(),
+        'started': None,
+        'finished': None,
+        'supervisor': None,
+        'log': log,
+        # Kept after the log has moved on to later runs.
+        'run_log': os.path.join(job_dir, '%s.log' % job_id),
+        'run_file': run_file,
+        'history_db': history_db,
+        'group_lock': group_lock,
+        'slot_locks': slot_locks,
+        'waiting_for': None,
+        'max_parallel': max_parallel,
+        'timeout': timeout,
+        'keep_runs': keep_runs,
+        'commands': [{
+            'id': command['id'],
+            'command': command['command'],
+            'after': command.get('after', []),
+            'depends_on': command.get('depends_on', []),
+            'state': QUEUED,
+            'pid': None,
+            'exit_code': None,
+            'started': None,
+            'finished': None,
+        } for command in commands],
+    }
+    save_job(get_job_path(job_dir, job['id']), job)
+    return job
+
+
+def start(path, group_lock=None, python=None):
+    """Starts a supervisor for the job saved to the file, run by the given
+    Python interpreter, or this one, returning once it has gone into the
+    background. Raises StartFailed if it exits before then.
+
+    If given group_lock, the held lock from try_lock(), the supervisor holds
+    on to it instead of waiting for the group. The caller still needs to
+    close its copy.
+    """
+    script = '%s.py' % os.path.splitext(os.path.abspath(__file__))[0]
+    args = [python or sys.executable, script, path]
+    with open(os.devnull, 'r+') as devnull:
+        stdin = devnull
+        if group_lock is not None:
+            # Only the standard streams are left open for the supervisor.
+            args.append(GROUP_LOCKED)
+            stdin = group_lock
+        # Kept to say why, if it fails to start.
+        errors = tempfile.TemporaryFile()
+        try:
+            try:
+                proc = subprocess.Popen(args, cwd='/', stdin=stdin,
+                                        stdout=devnull, stderr=errors,
+                                        close_fds=True)
+            except OSError, e:
+                raise StartFailed('Unable to run %s: %s' % (args[0], e))
+            # Only waits for the first fork to exit.
+            if proc.wait() != 0:
+                errors.seek(0)
+                raise StartFailed('%s exited with %s: %s' % (
+                    args[0], proc.returncode, errors.read().strip()))
+        finally:
+            errors.close()
+
+
+def cancel(job):
+    """Asks the job's supervisor to stop the job, and any commands it is
+    running. Returns False if there is no supervisor to ask.
+    """
+    if not job.get('supervisor'):
+        return False
+    try:
+        os.kill(job['supervisor'], signal.SIGTERM)
+    except OSError, e:
+        if e.errno == errno.ESRCH:
+            return False
+        raise
+    return True
+
+
+def kill(pid, sig):
+    """Sends the signal to the command's process group, which holds any
+    processes it started.
+    """
+    try:
+        os.killpg(pid, sig)
+    except OSError, e:
+        if e.errno != errno.ESRCH:
+            raise
+
+
+def _on_cancel(signum, frame):
+    _cancel['requested'] = True
+    if _cancel['interrupt']:
+        raise Cancelled()
+
+
+def _on_alarm(signum, frame):
+    # Only interrupts waiting for commands, to check on the job.
+    pass
+
+
+def _take_stdin():
+    # Return the file handed over as standard input, which is then pointed
+    # at /dev/null, so commands don't inherit it.
+    fp = os.fdopen(os.dup(0), 'a')
+    fd = os.open(os.devnull, os.O_RDWR)
+    os.dup2(fd, 0)
+    os.close(fd)
+    return fp
+
+
+def _daemonize():
+    # Carry on in a new session, apart from the process that started us, so
+    # nothing that happens to it or its process group reaches the job.
+    if os.fork():
+        os._exit(0)
+    os.setsid()
+    # Errors starting up went to the process that started us. Any after
+    # that are noted in the job.
+    fd = os.open(os.devnull, os.O_RDWR)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+
+def _note_pid(job, pid):
+    # Add to the process ids that log viewers check to see if the job is
+    # still going.
+    with open(job['run_file'], 'a') as rp:
+        rp.write('%d\n' % pid)
+
+
+def _start_log(job):
+    # Start the run's log as a new file, kept for the run history, and have
+    # the group's log name point to it.
+    open(job['run_log'], 'w').close()
+    dirname, basename = os.path.split(job['log'])
+    tmpname = os.path.join(dirname, '.%s.%s' % (basename, job['id']))
+    try:
+        os.link(job['run_log'], tmpname)
+    except OSError, e:
+        # Likely on another filesystem, so the log only lasts until the next
+        # run of the group.
+        os.remove(job['run_log'])
+        job['run_log'] = None
+        job['log_error'] = str(e)
+        open(job['log'], 'w').close()
+        return
+    os.rename(tmpname, job['log'])
+
+
+def _record(conn, job, position=None):
+    # Save the run, or one of its commands, to the history. A history that
+    # can't be written to doesn't stop the job.
+    if conn is None:
+        return
+    try:
+        if position is None:
+            history.record_run(conn, job)
+        else:
+            history.record_command(conn, job, position)
+    except sqlite3.Error, e:
+        job['history_error'] = str(e)
+
+
+def _delete_old_runs(job_dir, job, conn):
+    # Delete all but the latest runs of the group, this one included. Jobs
+    # still waiting to run are kept, and don't count. Only the supervisor
+    # holding the group lock deletes runs of the group.
+    keep = job.get('keep_runs')
+    if not keep:
+        return
+    jobs = []
+    for filename in os.listdir(job_dir):
+        if filename.startswith('.') or not filename.endswith('.json'):
+            continue
+        other = load_job(os.path.join(job_dir, filename))
+        if (other is not None and other['menu'] == job['menu'] and
+                other['group'] == job['group'] and other['state'] != QUEUED):
+            jobs.append(other)
+    jobs.sort(key=lambda other: other['created'], reverse=True)
+    for other in jobs[keep:]:
+        for name in (other.get('run_log'), get_job_path(job_dir, other['id'])):
+            try:
+                if name:
+                    os.remove(name)
+            except OSError, e:
+                # Runs that can't be deleted don't stop the job.
+                if e.errno != errno.ENOENT:
+                    job['delete_error'] = str(e)
+    if conn is not None:
+        try:
+            history.delete_old_runs(conn, job['menu'], job['group'], keep)
+        except sqlite3.Error, e:
+            job['history_error'] = str(e)
+
+
+def _is_sequential(job):
+    # Return True if the commands can only run one at a time, each after the
+    # one before it.
+    if job.get('max_parallel', 1) <= 1:
+        return True
+    commands = job['commands']
+    for before, command in zip(commands, commands[1:]):
+        if before['id'] not in command['after'] + command['depends_on']:
+            return False
+    return True
+
+
+def _copy_output(stream, prefix, lp, log_lock):
+    # Copy a command's output to the log a line at a time, each line marked
+    # with the command it came from, so output of commands running at the
+    # same time can be told apart.
+    for line in iter(stream.readline, ''):
+        with log_lock:
+            lp.write('%s%s' % (prefix, line))
+            if not line.endswith('\n'):
+                lp.write('\n')
+            lp.flush()
+    stream.close()
+
+
+def _skip_dependents(job):
+    # Skip queued commands that depend on a command that did not succeed,
+    # returning their positions.
+    by_id = dict((c['id'], c) for c in job['commands'])
+    skipped = []
+    changed = True
+    while changed:
+        changed = False
+        for position, command in enumerate(job['commands']):
+            if command['state'] != QUEUED:
+                continue
+            if any(by_id[i]['state'] in (FAILED, SKIPPED)
+                   for i in command['depends_on'] if i in by_id):
+                command['state'] = SKIPPED
+                command['finished'] = time.time()
+                skipped.append(position)
+                changed = True
+    return skipped
+
+
+def _get_ready(job):
+    # Return positions of queued commands whose turn has come.
+    by_id = dict((c['id'], c) for c in job['commands'])
+    ready = []
+    for position, command in enumerate(job['commands']):
+        if command['state'] != QUEUED:
+            continue
+        if all(by_id[i]['state'] in (DONE, FAILED, SKIPPED)
+               for i in command['after'] + command['depends_on']
+               if i in by_id):
+            ready.append(position)
+    return ready
+
+
+def _get_usage(rusage):
+    # Return what a command used, including the processes it waited for.
+    return {
+        'user_time': rusage.ru_utime,
+        'system_time': rusage.ru_stime,
+        # In KiB.
+        'max_rss': rusage.ru_maxrss,
+        'block_in': rusage.ru_inblock,
+        'block_out': rusage.ru_oublock,
+        'voluntary_switches': rusage.ru_nvcsw,
+        'involuntary_switches': rusage.ru_nivcsw,
+    }
+
+
+def _wait(timeout):
+    # Return (pid, status, resource usage) of the next child process to
+    # exit, or None if none has within timeout seconds, or a signal came.
+    signal.setitimer(signal.ITIMER_REAL, max(timeout, 0.01))
+    try:
+        return os.wait4(-1, 0)
+    except OSError, e:
+        if e.errno != errno.EINTR:
+            raise
+        return None
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _stop(job, reason, running, lp, log_lock):
+    # Stop running commands, and cancel those not yet started.
+    if reason == TIMED_OUT:
+        message = 'Timed out after %s seconds, stopping.' % job['timeout']
+    else:
+        message = 'Cancelled, stopping.'
+    with log_lock:
+        lp.write('%s\n' % message)
+        lp.flush()
+    job['error'] = message
+    for command in job['commands']:
+        if command['state'] == QUEUED:
+            command['state'] = CANCELLED
+    for pid in running:
+        kill(pid, signal.SIGTERM)
+
+
+def _run_commands(path, job, conn, lp, env):
+    # Run the commands, as many at once as the job allows, each once the
+    # commands it runs after are done. Returns CANCELLED or TIMED_OUT if the
+    # job was stopped, otherwise None.
+    sequential = _is_sequential(job)
+    log_lock = threading.Lock()
+    # Process id: (position, process, output copier)
+    running = {}
+    stopped = None
+    stopped_at = None
+    deadline = None
+    if job.get('timeout'):
+        deadline = job['started'] + job['timeout']
+    while True:
+        now = time.time()
+        if stopped is None:
+            if _cancel['requested']:
+                stopped = CANCELLED
+            elif deadline is not None and now >= deadline:
+                stopped = TIMED_OUT
+            if stopped is not None:
+                stopped_at = now
+                _stop(job, stopped, running, lp, log_lock)
+                save_job(path, job)
+        elif now >= stopped_at + KILL_GRACE:
+            for pid in running:
+                kill(pid, signal.SIGKILL)
+
+        skipped = _skip_dependents(job)
+        if skipped:
+            save_job(path, job)
+            for position in skipped:
+                _record(conn, job, position)
+        ready = _get_ready(job)
+        if not ready and not running:
+            break
+        for position in ready:
+            if len(running) >= job['max_parallel']:
+                break
+            command = job['commands'][position]
+            prefix = '' if sequential else '[%s] ' % command['id']
+            command['state'] = RUNNING
+            command['started'] = time.time()
+            if sequential:
+                # Output of commands running at the same time is mixed, so
+                # only that of sequential commands has a byte range.
+                command['log_start'] = os.fstat(lp.fileno()).st_size
+            try:
+                # In a session of its own, so it and anything it starts can
+                # be stopped together.
+                proc = subprocess.Popen(
+                    command['command'].split(),
+                    stdout=lp if sequential else subprocess.PIPE,
+                    stderr=lp if sequential else subprocess.STDOUT,
+                    env=env, close_fds=True, preexec_fn=os.setsid)
+            except OSError, e:
+                with log_lock:
+                    lp.write('%sUnable to run "%s": %s\n' %
+                             (prefix, command['command'], e))
+                    lp.flush()
+                    if sequential:
+                        command['log_end'] = os.fstat(lp.fileno()).st_size
+                command['state'] = FAILED
+                command['finished'] = time.time()
+                command['error'] = str(e)
+                save_job(path, job)
+                _record(conn, job, position)
+                continue
+
+            copier = None
+            if not sequential:
+                copier = threading.Thread(
+                    target=_copy_output,
+                    args=(proc.stdout, prefix, lp, log_lock))
+                copier.daemon = True
+                copier.start()
+            running[proc.pid] = (position, proc, copier)
+            command['pid'] = proc.pid
+            save_job(path, job)
+            _note_pid(job, proc.pid)
+            _record(conn, job, position)
+
+        if not running:
+            # None of them could be started, which may let others go.
+            continue
+
+        # Wake up in time to check on the job, as a cancel that comes just
+        # before waiting does not interrupt it.
+        timeout = CHECK_INTERVAL
+        if stopped is not None:
+            timeout = min(timeout, stopped_at + KILL_GRACE - now)
+        elif deadline is not None:
+            timeout = min(timeout, deadline - now)
+        result = _wait(timeout)
+        if result is None:
+            continue
+        pid, status, rusage = result
+        if pid not in running:
+            continue
+        position, proc, copier = running.pop(pid)
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        if copier is not None:
+            # Output may still be held open by anything the command left
+            # running in the background, so only wait for it briefly.
+            copier.join(COPY_TIMEOUT)
+        command = job['commands'][position]
+        command['exit_code'] = proc.returncode
+        command['finished'] = time.time()
+        command['usage'] = _get_usage(rusage)
+        if sequential:
+            command['log_end'] = os.fstat(lp.fileno()).st_size
+        command['state'] = DONE if proc.returncode == 0 else FAILED
+        save_job(path, job)
+        _record(conn, job, position)
+
+    # Anything still queued is waiting on itself, through its dependencies.
+    for position, command in enumerate(job['commands']):
+        if command['state'] in (QUEUED, CANCELLED):
+            if command['state'] == QUEUED:
+                command['state'] = SKIPPED
+            command['finished'] = time.time()
+            _record(conn, job, position)
+    return stopped
+
+
+def run(path, group_lock=None):
+    """Runs the job's commands, each once those it comes after are done,
+    saving progress to the job file as it goes.
+
+    Waits for earlier jobs of the group to finish, unless given the group
+    lock already held, and for a free slot, first, and lets them go as soon
+    as the commands are done.
+    """
+    job = load_job(path)
+    job['supervisor'] = os.getpid()
+    if group_lock is None:
+        job['waiting_for'] = 'group'
+        save_job(path, job)
+        group_lock = _lock(job['group_lock'])
+    job['waiting_for'] = 'slot'
+    save_job(path, job)
+    slot_lock = _take_slot(job['slot_locks'])
+
+    # Once running, a cancel stops the commands instead.
+    _cancel['interrupt'] = False
+    if _cancel['requested']:
+        raise Cancelled()
+    job['state'] = RUNNING
+    job['waiting_for'] = None
+    job['started'] = time.time()
+    save_job(path, job)
+
+    # Note the new run, so log viewers know to start over.
+    _start_log(job)
+    with open(job['run_file'], 'w') as rp:
+        rp.write('%s\n' % job['id'])
+    _note_pid(job, os.getpid())
+
+    try:
+        conn = history.connect(job['history_db'])
+    except sqlite3.Error, e:
+        job['history_error'] = str(e)
+        conn = None
+    _record(conn, job)
+    _delete_old_runs(os.path.dirname(os.path.abspath(path)), job, conn)
+
+    # Have Python output be unbuffered so any output is logged immediately.
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    with open(job['log'], 'a') as lp:
+        stopped = _run_commands(path, job, conn, lp, env)
+    _let_slot_go(job['slot_locks'], slot_lock)
+    group_lock.close()
+
+    if stopped:
+        job['state'] = stopped
+    elif any(c['state'] != DONE for c in job['commands']):
+        job['state'] = FAILED
+    else:
+        job['state'] = DONE
+    job['finished'] = time.time()
+    _record(conn, job)
+    save_job(path, job)
+
+
+def main(argv):
+    if len(argv) not in (2, 3) or argv[2:] not in ([], [GROUP_LOCKED]):
+        sys.stderr.write('Usage: %s <job file> [%s]\n' %
+                         (argv[0], GROUP_LOCKED))
+        return 2
+    path = argv[1]
+    group_lock = None
+    if argv[2:] == [GROUP_LOCKED]:
+        group_lock = _take_stdin()
+    _daemonize()
+    signal.signal(signal.SIGTERM, _on_cancel)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    try:
+        run(path, group_lock)
+    except Cancelled:
+        # Asked to stop before any commands started.
+        job = load_job(path)
+        if job is not None:
+            job['state'] = CANCELLED
+            job['waiting_for'] = None
+            job['finished'] = time.time()
+            for command in job['commands']:
+                command['state'] = CANCELLED
+            save_job(path, job)
+        return 1
+    except Exception:
+        job = load_job(path)
+        if job is not None:
+            job['state'] = FAILED
+            job['finished'] = time.time()
+            job['error'] = traceback.format_exc()
+            save_job(path, job)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
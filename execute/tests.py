@@ -13,6 +13,75 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import os
+import shutil
+import signal
+import tempfile
+
 from django.test import TestCase
 
-# Create your tests here.
+from execute import supervisor
+
+
+class SchedulerTest(TestCase):
+    """Runs jobs in this process, as their supervisor would."""
+
+    def setUp(self):
+        self.job_dir = tempfile.mkdtemp()
+        self.alarm_handler = signal.signal(signal.SIGALRM,
+                                           supervisor._on_alarm)
+
+    def tearDown(self):
+        signal.signal(signal.SIGALRM, self.alarm_handler)
+        shutil.rmtree(self.job_dir)
+
+    def _run(self, commands, max_parallel=1):
+        # Run the commands, each given as (id, command line, ids of those
+        # it depends on), and return the finished job.
+        job_dir = self.job_dir
+        job = supervisor.new_job(
+            job_dir, 'Menu', 'Group', 'action',
+            [{'id': cmd_id, 'command': command, 'depends_on': depends_on}
+             for cmd_id, command, depends_on in commands],
+            os.path.join(job_dir, 'group.log'),
+            os.path.join(job_dir, 'group.run'),
+            os.path.join(job_dir, 'group.lock'),
+            [os.path.join(job_dir, 'slot.lock')],
+            os.path.join(job_dir, 'history.db'), max_parallel)
+        path = supervisor.get_job_path(job_dir, job['id'])
+        supervisor.run(path)
+        return supervisor.load_job(path)
+
+    def test_dependency_order(self):
+        job = self._run([('a', 'sleep 0.2', []), ('b', 'true', ['a']),
+                         ('c', 'true', ['b'])], max_parallel=3)
+        a, b, c = job['commands']
+        self.assertEqual(job['state'], supervisor.DONE)
+        self.assertTrue(a['finished'] <= b['started'])
+        self.assertTrue(b['finished'] <= c['started'])
+
+    def test_skip_on_failure(self):
+        job = self._run([('a', 'false', []), ('b', 'true', ['a']),
+                         ('c', 'true', ['b']), ('d', 'true', [])],
+                        max_parallel=2)
+        self.assertEqual(job['state'], supervisor.FAILED)
+        self.assertEqual([c['state'] for c in job['commands']],
+                         [supervisor.FAILED, supervisor.SKIPPED,
+                          supervisor.SKIPPED, supervisor.DONE])
+        self.assertEqual(job['commands'][0]['exit_code'], 1)
+        self.assertEqual(job['commands'][1]['pid'], None)
+
+    def test_max_parallel(self):
+        job = self._run([(str(i), 'sleep 0.2', []) for i in range(5)],
+                        max_parallel=2)
+        self.assertEqual(job['state'], supervisor.DONE)
+        # Most commands running at any one time.
+        events = []
+        for command in job['commands']:
+            events.append((command['started'], 1))
+            events.append((command['finished'], -1))
+        running = most = 0
+        for when, change in sorted(events):
+            running += change
+            most = max(most, running)
+        self.assertEqual(most, 2)
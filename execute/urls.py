@@ -24,4 +24,9 @@ urlpatterns = patterns('',
     url(r'^$', login_required_ajax(views.index), name='index'),
     url(r'^run$', login_required_ajax(views.run_commands), name='run'),
     url(r'^tail$', login_required_ajax(views.tail_log), name='tail'),
+    url(r'^stream$', login_required_ajax(views.stream_log), name='stream'),
+    url(r'^job$', login_required_ajax(views.job_status), name='job'),
+    url(r'^cancel$', login_required_ajax(views.cancel_job), name='cancel'),
+    url(r'^history$', login_required_ajax(views.run_history),
+        name='history'),
 )
@@ -14,26 +14,153 @@
 #  limitations under the License.
 #
 import fcntl
+import hashlib
+import json
 import logging
 import os
-import subprocess
+import re
+import sqlite3
+import sys
+import threading
 import time
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.shortcuts import render
 from django.template.defaultfilters import slugify
 
-from chaperone.utils import yaml
+from chaperone.decorators import revalidate
+from chaperone.utils import metrics, schema, system, watch, yaml
+from execute import history, supervisor
 
 LOG = logging.getLogger(__name__)
 
+# Seconds between comments sent to keep an idle log stream open.
+STREAM_KEEPALIVE = 15
+# Seconds to wait for the next command of a run to start before ending a
+# log stream, for runs without a job.
+STREAM_GRACE = 2
+# Most seconds between checks of whether the run being streamed is done, in
+# case its supervisor went away without saying so.
+STREAM_CHECK_INTERVAL = 2
+# Milliseconds browsers wait before connecting again to a log stream that
+# has ended.
+STREAM_RETRY = 10000
+
+# Job files, noting the state of the commands of each run.
+JOB_DIR = getattr(settings, 'CHAPERONE_JOB_DIR',
+                  os.path.join(settings.CHAPERONE_LOG_DIR, 'jobs'))
+# SQLite database of past runs and how long each command took.
+HISTORY_DB = getattr(settings, 'EXECUTE_HISTORY_DB',
+                     os.path.join(JOB_DIR, 'history.db'))
+# Most runs returned by the history at once.
+HISTORY_LIMIT = 200
+# Runs of each group whose job files, logs and history are kept.
+KEEP_RUNS = getattr(settings, 'EXECUTE_KEEP_RUNS', 50)
+# Most commands of a job running at once, where their dependencies allow.
+MAX_PARALLEL_COMMANDS = getattr(settings, 'EXECUTE_MAX_PARALLEL_COMMANDS', 4)
+# Most jobs running at once, across all groups.
+MAX_RUNNING_JOBS = getattr(settings, 'EXECUTE_MAX_RUNNING_JOBS', 4)
+# Whether to queue runs of a group that is already running, rather than
+# turn them away.
+QUEUE_GROUP_RUNS = getattr(settings, 'EXECUTE_QUEUE_GROUP_RUNS', False)
+# Python interpreter to run job supervisors with. Under mod_wsgi, the web
+# server's own program is not one.
+PYTHON = getattr(settings, 'EXECUTE_PYTHON', None) or sys.executable
+# Most log streams open at once in each web server process, as each one
+# holds a worker thread. Browsers turned away poll for output instead.
+MAX_LOG_STREAMS = getattr(settings, 'EXECUTE_MAX_LOG_STREAMS', 4)
+# Seconds after which a log stream is closed, letting its worker go. The
+# browser then connects again, and may be turned away.
+LOG_STREAM_LIFETIME = getattr(settings, 'EXECUTE_LOG_STREAM_LIFETIME', 600)
+
+_stream_slots = threading.BoundedSemaphore(MAX_LOG_STREAMS)
+
 
 def _get_logname(menu_name, group_name):
     return '%s/%s_%s.log' % (settings.CHAPERONE_LOG_DIR, slugify(menu_name),
                              slugify(group_name))
 
 
+def _get_runname(menu_name, group_name):
+    # File holding the id of the latest run writing to the group's log, which
+    # is the id of its job, followed by the process ids of its supervisor and
+    # the commands it has started.
+    return '%s.run' % _get_logname(menu_name, group_name)
+
+
+def _get_lock_dir():
+    lock_dir = os.path.join(JOB_DIR, 'locks')
+    if not os.path.isdir(lock_dir):
+        os.makedirs(lock_dir)
+    return lock_dir
+
+
+def _get_lockname(menu_name, group_name):
+    # File locked while a job of the group is running.
+    return '%s/%s_%s.lock' % (_get_lock_dir(), slugify(menu_name),
+                              slugify(group_name))
+
+
+def _get_slot_locknames():
+    # Files, one of which is locked by each running job.
+    return ['%s/slot-%d.lock' % (_get_lock_dir(), n)
+            for n in range(MAX_RUNNING_JOBS)]
+
+
+def _read_run(menu_name, group_name):
+    # Return the id and command process ids of the latest run.
+    runname = _get_runname(menu_name, group_name)
+    if not os.path.exists(runname):
+        return '', []
+    with open(runname, 'r') as rp:
+        lines = rp.read().split()
+    if not lines:
+        return '', []
+    return lines[0], [int(pid) for pid in lines[1:]]
+
+
+def _get_run_id(menu_name, group_name):
+    return _read_run(menu_name, group_name)[0]
+
+
+def _is_run_active(menu_name, group_name):
+    # Return True if any command started by the latest run is still going.
+    pids = _read_run(menu_name, group_name)[1]
+    return any(system.is_running(pid) for pid in pids)
+
+
+def _decode_output(data):
+    # Return the bytes read from a log as text, leaving off a multibyte
+    # character cut short at the end, which is returned in full by the next
+    # read. Returns (text, number of bytes used).
+    try:
+        return data.decode('utf-8'), len(data)
+    except UnicodeDecodeError, err:
+        if err.end == len(data) and len(data) - err.start < 4:
+            data = data[:err.start]
+        return data.decode('utf-8', 'replace'), len(data)
+
+
+def _read_log(logname, offset=0):
+    # Return the output written to the log after the given byte offset, and
+    # the offset to read from next time.
+    if not os.path.exists(logname):
+        return '', 0
+    with open(logname, 'rb') as lp:
+        fcntl.flock(lp, fcntl.LOCK_SH)
+        size = os.fstat(lp.fileno()).st_size
+        if offset > size:
+            # Log was started over by a new run.
+            offset = 0
+        lp.seek(offset)
+        data = lp.read(size - offset)
+        fcntl.flock(lp, fcntl.LOCK_UN)
+    output, length = _decode_output(data)
+    return output, offset + length
+
+
 def _get_actions(menu_name, group_name):
     # Return action metadata for the given group. See
     # chaperone/local_settings.py.example for schema.
@@ -55,30 +182,102 @@ def _get_actions(menu_name, group_name):
     return []
 
 
+def _get_file_version(filename):
+    # Return (mtime, size) of the file, or None if it does not exist.
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return st.st_mtime, st.st_size
+
+
+def _get_log_version(menu_name, group_name):
+    # Return a value that changes whenever the group's log or run does.
+    return (_get_file_version(_get_logname(menu_name, group_name)),
+            _get_file_version(_get_runname(menu_name, group_name)))
+
+
+def _get_index_etag(request):
+    # The page changes along with the schema, the log, the run history, and
+    # the CSRF token.
+    menu_name = request.REQUEST.get('mname')
+    group_name = request.REQUEST.get('gname')
+    base = "%s/%s" % (settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
+    return hashlib.sha1(repr((
+        menu_name, group_name, yaml.version(base),
+        _get_log_version(menu_name, group_name),
+        _get_file_version(HISTORY_DB),
+        get_token(request) or ''))).hexdigest()
+
+
+def _get_last_run(menu_name, group_name):
+    # Return the group's latest run from the history, or None.
+    if not os.path.exists(HISTORY_DB):
+        return None
+    try:
+        conn = history.connect(HISTORY_DB)
+        try:
+            runs = history.get_runs(conn, menu=menu_name, group=group_name,
+                                    limit=1)
+        finally:
+            conn.close()
+    except sqlite3.Error, e:
+        LOG.error('Unable to read run history: %s' % e)
+        return None
+    return runs[0] if runs else None
+
+
+@revalidate(_get_index_etag)
 def index(request):
     """Show knobs to start running the commands."""
     menu_name = request.REQUEST.get('mname')
     group_name = request.REQUEST.get('gname')
     actions = _get_actions(menu_name, group_name)
 
+    run_id = _get_run_id(menu_name, group_name)
     logname = _get_logname(menu_name, group_name)
-    file_contents = ''
-    if os.path.exists(logname):
-        with open(logname, 'r') as lp:
-            fcntl.flock(lp, fcntl.LOCK_SH)
-            file_contents = lp.read()
-            fcntl.flock(lp, fcntl.LOCK_UN)
+    file_contents, offset = _read_log(logname)
 
-    return render(request, 'execute/_group.html', {
-        'menu_name': menu_name,
-        'group_name': group_name,
-        'actions': actions,
-        'log_contents': file_contents,
-    })
+    with metrics.timer('chaperone_template_render_seconds',
+                       template='execute/_group.html'):
+        return render(request, 'execute/_group.html', {
+            'menu_name': menu_name,
+            'group_name': group_name,
+            'actions': actions,
+            'log_contents': file_contents,
+            'log_offset': offset,
+            'log_run': run_id,
+            'last_run': _get_last_run(menu_name, group_name),
+        })
+
+
+def _get_commands(act, arguments):
+    # Return commands of the action for the job supervisor. Commands without
+    # depends_on run after the one before them, whether or not it succeeded.
+    commands = []
+    for position, cmd in enumerate(act.get('commands', [])):
+        command = {
+            'id': str(position + 1),
+            'after': [commands[-1]['id']] if commands else [],
+            'depends_on': [],
+        }
+        if isinstance(cmd, dict):
+            command['id'] = str(cmd.get('id', command['id']))
+            if 'depends_on' in cmd:
+                command['after'] = []
+                command['depends_on'] = schema.get_ids(cmd['depends_on'] or '')
+            cmd = cmd.get('command', '')
+        if arguments:
+            cmd = '%s %s' % (cmd, ' '.join(arguments))
+        command['command'] = cmd
+        commands.append(command)
+    return commands
 
 
 def run_commands(request):
-    """Run the commands for the given action."""
+    """Start running the commands for the given action in the background,
+    returning the id of the job doing so.
+    """
     menu_name = request.REQUEST.get('mname')
     group_name = request.REQUEST.get('gname')
     action_id = request.REQUEST.get('aid')
@@ -86,57 +285,381 @@ def run_commands(request):
 
     LOG.debug('Preparing to run command from %s/%s/%s' % (menu_name, group_name, action_id))
 
-    commands = []
+    action = {}
     arguments = []
     for act in actions:
         act_id = act['id']
         LOG.debug('... checking act_id (%s) == action_id (%s)' % (act_id, action_id))
         if act_id == action_id:
             LOG.debug('... found act_id (%s) == action_id (%s)' % (act_id, action_id))
-            commands = act.get('commands', [])
+            action = act
         arg = act.get('argument')
         if arg and request.REQUEST.get(act_id) == '1':
             LOG.debug('... appending arg: %s' % arg)
             arguments.append(arg)
 
+    lockname = _get_lockname(menu_name, group_name)
+    group_lock = None
+    if not QUEUE_GROUP_RUNS:
+        # Taken here, and handed over to the job's supervisor, so no other
+        # run of the group can start in between.
+        group_lock = supervisor.try_lock(lockname)
+        if group_lock is None:
+            LOG.info('Not running %s/%s/%s, group already running' %
+                     (menu_name, group_name, action_id))
+            data = {
+                'errors': ['%s is already running.' % group_name],
+            }
+            return HttpResponse(json.dumps(data),
+                                content_type='application/json')
+
     logname = _get_logname(menu_name, group_name)
-    with open(logname, 'w+') as lp:
-        num_cmds = len(commands)
-        LOG.debug('... num_cmds = %d' % num_cmds)
-        for i in range(0, num_cmds):
-            cmd = commands[i]
-            if arguments:
-                cmd = '%s %s' % (cmd, ' '.join(arguments))
-
-            LOG.debug('... cmd: %s' % cmd)
-
-            # Set Python output to be unbuffered so any output is returned
-            # immediately.
-            env = os.environ
-            env['PYTHONUNBUFFERED'] = '1'
-            LOG.debug('Running "%s"' % cmd)
-            proc = subprocess.Popen(cmd.split(), stdout=lp, stderr=lp, env=env)
-            # Wait for each process to finish except for the last one, in case
-            # later commands have dependencies on earlier ones.
-            if not i == num_cmds -1:
-                proc.wait()
-    # AJAX polling will check for output.
-    return HttpResponse('')
+    runname = _get_runname(menu_name, group_name)
+    commands = _get_commands(action, arguments)
+    timeout = None
+    if action.get('timeout'):
+        try:
+            timeout = float(action['timeout'])
+        except ValueError:
+            LOG.error('Ignoring timeout of %s/%s/%s, not a number: %s' %
+                      (menu_name, group_name, action_id, action['timeout']))
+    try:
+        job = supervisor.new_job(JOB_DIR, menu_name, group_name, action_id,
+                                 commands, logname, runname, lockname,
+                                 _get_slot_locknames(), HISTORY_DB,
+                                 MAX_PARALLEL_COMMANDS, timeout, KEEP_RUNS)
+
+        # Once earlier runs of the group are done and there is a free slot,
+        # the job notes the new run, so log viewers know to start over.
+        LOG.debug('Starting job %s to run %s' %
+                  (job['id'], [c['command'] for c in commands]))
+        path = supervisor.get_job_path(JOB_DIR, job['id'])
+        try:
+            supervisor.start(path, group_lock, PYTHON)
+        except supervisor.StartFailed, e:
+            LOG.error('Unable to start job %s: %s' % (job['id'], e))
+            job['state'] = supervisor.FAILED
+            job['finished'] = time.time()
+            job['error'] = str(e)
+            supervisor.save_job(path, job)
+            data = {
+                'errors': ['Unable to start %s: %s' % (group_name, e)],
+            }
+            return HttpResponse(json.dumps(data),
+                                content_type='application/json')
+    finally:
+        if group_lock is not None:
+            # The supervisor has its own copy.
+            group_lock.close()
+    # Log streaming, or AJAX polling, will check for output, and the job
+    # status for how the commands did.
+    data = {
+        'job': job['id'],
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def _load_job(job_id):
+    # Return the job with the given id, or None if there is no such job.
+    if not re.match(r'^[0-9a-f]+$', job_id or ''):
+        return None
+    return supervisor.load_job(supervisor.get_job_path(JOB_DIR, job_id))
+
 
+def _get_job(request):
+    # Return the job with the given id, or the latest job of the group, or
+    # None if there is no such job.
+    job_id = request.REQUEST.get('id')
+    if not job_id:
+        job_id = _get_run_id(request.REQUEST.get('mname'),
+                             request.REQUEST.get('gname'))
+    return _load_job(job_id)
 
+
+def job_status(request):
+    """Return the state of a job and each of its commands, with their exit
+    codes and times, given the job id, or for the latest job of the group.
+    """
+    job = _get_job(request)
+    if job is None:
+        return HttpResponse(json.dumps({'error': 'No such job.'}),
+                            content_type='application/json', status=404)
+
+    if (job['state'] == supervisor.RUNNING and
+            not system.is_running(job['supervisor'])):
+        # Supervisor was stopped before it could finish.
+        job['state'] = supervisor.LOST
+    for key in ('log', 'run_log', 'run_file', 'history_db', 'group_lock',
+                'slot_locks'):
+        job.pop(key, None)
+    return HttpResponse(json.dumps(job), content_type='application/json')
+
+
+def cancel_job(request):
+    """Stop a job, given its id, or the group's running job. Running
+    commands are sent SIGTERM, and SIGKILL if they have not exited a few
+    seconds later, and commands not yet started are cancelled.
+
+    Jobs queued behind a running job of the group can only be cancelled by
+    id.
+    """
+    job = _get_job(request)
+    if job is None:
+        return HttpResponse(json.dumps({'errors': ['No such job.']}),
+                            content_type='application/json', status=404)
+    if job['state'] not in (supervisor.QUEUED, supervisor.RUNNING):
+        data = {
+            'errors': ['%s is not running.' % job['group']],
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+    if not job['supervisor']:
+        data = {
+            'errors': ['%s is still starting, try again.' % job['group']],
+        }
+        return HttpResponse(json.dumps(data), content_type='application/json')
+
+    LOG.info('Cancelling job %s of %s/%s' % (job['id'], job['menu'],
+                                             job['group']))
+    # A running job's supervisor holds the group lock, so if nothing does,
+    # the process with its id is some other one.
+    alive = system.is_running(job['supervisor'])
+    if job['state'] == supervisor.RUNNING:
+        alive = alive and supervisor.is_locked(job['group_lock'])
+    if not (alive and supervisor.cancel(job)):
+        # Supervisor went away. Process ids of commands it left may since
+        # have been reused, so nothing is signalled, and the job is only
+        # noted as over.
+        LOG.warn('Supervisor of job %s is gone' % job['id'])
+        if job['state'] == supervisor.RUNNING:
+            job['state'] = supervisor.LOST
+        else:
+            job['state'] = supervisor.CANCELLED
+        job['finished'] = time.time()
+        supervisor.save_job(supervisor.get_job_path(JOB_DIR, job['id']), job)
+    data = {
+        'job': job['id'],
+        'state': job['state'],
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def run_history(request):
+    """Return the latest runs, optionally only of the given group or action,
+    with the arguments, exit code, times and log byte range of each command.
+    Commands that ran at the same time as others have no byte range, as
+    their output is mixed, prefixed by their ids.
+    """
+    try:
+        limit = min(max(int(request.REQUEST.get('limit', 50)), 1),
+                    HISTORY_LIMIT)
+    except ValueError:
+        limit = 50
+    data = {'runs': []}
+    if os.path.exists(HISTORY_DB):
+        try:
+            conn = history.connect(HISTORY_DB)
+            try:
+                data['runs'] = history.get_runs(
+                    conn, menu=request.REQUEST.get('mname'),
+                    group=request.REQUEST.get('gname'),
+                    action=request.REQUEST.get('aid'), limit=limit)
+            finally:
+                conn.close()
+        except sqlite3.Error, e:
+            LOG.error('Unable to read run history: %s' % e)
+            data['errors'] = ['Unable to read run history: %s' % e]
+    for run in data['runs']:
+        # Logs are only read through the log views.
+        del run['log']
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def _get_tail_etag(request):
+    # Output since the offset only changes along with the log and run.
+    menu_name = request.REQUEST.get('mname')
+    group_name = request.REQUEST.get('gname')
+    return hashlib.sha1(repr((
+        menu_name, group_name, request.REQUEST.get('run'),
+        request.REQUEST.get('offset'),
+        _get_log_version(menu_name, group_name)))).hexdigest()
+
+
+@revalidate(_get_tail_etag)
 def tail_log(request):
-    """Return output written to the log file for this group since the last
-    call made to this.
+    """Return output written to the log file for this group after the given
+    offset, along with the offset to ask for next and the id of the run that
+    wrote it. All output is returned if the run has changed since.
     """
     menu_name = request.REQUEST.get('mname')
     group_name = request.REQUEST.get('gname')
+    run_id = request.REQUEST.get('run')
+    try:
+        offset = max(int(request.REQUEST.get('offset', 0)), 0)
+    except ValueError:
+        offset = 0
+
+    current_run_id = _get_run_id(menu_name, group_name)
+    reset = run_id != current_run_id
+    if reset:
+        offset = 0
+    logname = _get_logname(menu_name, group_name)
+    output, new_offset = _read_log(logname, offset)
+    data = {
+        'run': current_run_id,
+        'offset': new_offset,
+        'output': output,
+        # Offset goes backwards if the log was started over.
+        'reset': reset or new_offset < offset,
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def _format_event(event, data, event_id=None):
+    # Return a server-sent event, with the data sent as JSON.
+    lines = []
+    if event_id is not None:
+        lines.append('id: %s' % event_id)
+    lines.append('event: %s' % event)
+    lines.append('data: %s' % json.dumps(data))
+    return '%s\n\n' % '\n'.join(lines)
+
+
+def _is_job_active(run_id):
+    # Return True if the run's job is going, False if it is done, or None if
+    # the run has no job to go by.
+    job = _load_job(run_id)
+    if job is None:
+        return None
+    return (job['state'] in (supervisor.QUEUED, supervisor.RUNNING) and
+            system.is_running(job['supervisor'] or 0))
+
+
+class _LogStream(object):
+    # Events of a log stream, holding one of the process's stream slots until
+    # the server closes the response, whether or not the events were sent.
+
+    def __init__(self, events):
+        self._events = events
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self._events)
+
+    def close(self):
+        self._events.close()
+        if not self._closed:
+            self._closed = True
+            _stream_slots.release()
+
+
+def _stream_log(menu_name, group_name, run_id, offset):
+    # Yield server-sent events with output written to the group's log after
+    # the given offset, for as long as the latest run is going, or until the
+    # stream has been open for LOG_STREAM_LIFETIME seconds.
     logname = _get_logname(menu_name, group_name)
+    runname = _get_runname(menu_name, group_name)
+    watcher = None
+    watched_run_id = None
+    try:
+        yield 'retry: %d\n\n' % STREAM_RETRY
+        grace = False
+        last_sent = time.time()
+        deadline = last_sent + LOG_STREAM_LIFETIME
+        while True:
+            current_run_id = _get_run_id(menu_name, group_name)
+            if watcher is None or watched_run_id != current_run_id:
+                # Also watch the run's job file, which its supervisor saves
+                # when the run is done.
+                if watcher is not None:
+                    watcher.close()
+                watched_run_id = current_run_id
+                watcher = watch.FileWatcher([
+                    logname, runname,
+                    supervisor.get_job_path(JOB_DIR, current_run_id or '-')])
+
+            # Checked before reading, so all output of a finished run is read.
+            job_active = _is_job_active(current_run_id)
+            active = job_active
+            if active is None:
+                active = _is_run_active(menu_name, group_name)
+
+            reset = run_id != current_run_id
+            if reset:
+                run_id = current_run_id
+                offset = 0
+            output, new_offset = _read_log(logname, offset)
+            reset = reset or new_offset < offset
+            offset = new_offset
+            if output or reset:
+                yield _format_event('log', {
+                    'run': run_id,
+                    'offset': offset,
+                    'output': output,
+                    'reset': reset,
+                }, event_id='%s:%d' % (run_id, offset))
+                last_sent = time.time()
+
+            if active:
+                grace = False
+                timeout = STREAM_CHECK_INTERVAL
+            elif grace or job_active is False:
+                # The job is done, or nothing has started since the last
+                # command finished.
+                yield _format_event('end', {'run': run_id, 'offset': offset})
+                return
+            else:
+                # Give the next command of the run a chance to start.
+                grace = True
+                timeout = STREAM_GRACE
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                # Ended without an end event, so the browser connects again.
+                return
+            watcher.wait(min(timeout, remaining))
+            if time.time() - last_sent >= STREAM_KEEPALIVE:
+                yield ': keepalive\n\n'
+                last_sent = time.time()
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+
+def stream_log(request):
+    """Stream output written to the log file for this group as server-sent
+    events, starting after the given offset, until the run writing it is done,
+    which is sent as an end event.
+
+    Browsers that lose the connection before then connect again, picking up
+    from the id of the last event. Once EXECUTE_MAX_LOG_STREAMS are open,
+    others are turned away with a 503, and browsers poll instead.
+    """
+    menu_name = request.REQUEST.get('mname')
+    group_name = request.REQUEST.get('gname')
+    run_id = request.REQUEST.get('run')
+    offset = request.REQUEST.get('offset', 0)
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID')
+    if last_event_id:
+        # Reconnecting.
+        run_id, _, offset = last_event_id.rpartition(':')
+    try:
+        offset = max(int(offset), 0)
+    except ValueError:
+        offset = 0
 
-    file_contents = ''
-    if os.path.exists(logname):
-        with open(logname, 'r') as lp:
-            # Read what has been written to the file so far.
-            fcntl.flock(lp, fcntl.LOCK_SH)
-            file_contents = lp.read()
-            fcntl.flock(lp, fcntl.LOCK_UN)
-    return HttpResponse(file_contents, content_type='text/plain')
+    if not _stream_slots.acquire(False):
+        LOG.debug('Too many log streams open, turning away %s/%s' %
+                  (menu_name, group_name))
+        response = HttpResponse('Too many log streams open.\n', status=503,
+                                content_type='text/plain')
+        response['Retry-After'] = str(STREAM_RETRY // 1000)
+        return response
+    response = StreamingHttpResponse(
+        _LogStream(_stream_log(menu_name, group_name, run_id, offset)),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keep proxies from holding on to events.
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -13,6 +13,221 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import os
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from chaperone.utils import yaml
+from prepare import views
+
+
+class DownloadTest(TestCase):
+    """Downloads of prepared files, whole or in part."""
+
+    CONTENT = '0123456789'
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        with open(os.path.join(self.dir, 'f1'), 'wb') as fp:
+            fp.write(self.CONTENT)
+        self.settings = override_settings(PREPARE_FILES_DIR=self.dir)
+        self.settings.enable()
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.dir)
+
+    def _download(self, **headers):
+        response = views.download_file(self.factory.get('/', **headers),
+                                       'f1')
+        if response.streaming:
+            body = ''.join(response.streaming_content)
+        else:
+            body = response.content
+        response.close()
+        return response, body
+
+    def _get_range(self, header, size=10):
+        request = self.factory.get('/', HTTP_RANGE=header)
+        return views._get_range(request, size, '"etag"', 'date')
+
+    def test_ranges(self):
+        self.assertEqual(self._get_range('bytes=2-4'), (2, 4))
+        # Open ended.
+        self.assertEqual(self._get_range('bytes=7-'), (7, 9))
+        # Past the end.
+        self.assertEqual(self._get_range('bytes=5-100'), (5, 9))
+        # Suffix.
+        self.assertEqual(self._get_range('bytes=-3'), (7, 9))
+        self.assertEqual(self._get_range('bytes=-30'), (0, 9))
+
+    def test_whole_file_ranges(self):
+        for header in ('', 'junk', 'bytes=1-2,4-5', 'bytes=4-2',
+                       'bytes=a-b'):
+            self.assertEqual(self._get_range(header), None, header)
+
+    def test_unsatisfiable_ranges(self):
+        self.assertEqual(self._get_range('bytes=10-'), False)
+        self.assertEqual(self._get_range('bytes=-0'), False)
+        self.assertEqual(self._get_range('bytes=-3', size=0), False)
+
+    def test_whole_file(self):
+        response, body = self._download()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CONTENT)
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertTrue(response.file_to_stream is not None)
+
+    def test_partial(self):
+        response, body = self._download(HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, '234')
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(response['Content-Length'], '3')
+
+    def test_multiple_ranges(self):
+        response, body = self._download(HTTP_RANGE='bytes=1-2,4-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CONTENT)
+
+    def test_unsatisfiable(self):
+        response, body = self._download(HTTP_RANGE='bytes=20-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_if_range(self):
+        etag = self._download()[0]['ETag']
+        response, body = self._download(HTTP_RANGE='bytes=2-4',
+                                        HTTP_IF_RANGE=etag)
+        self.assertEqual(body, '234')
+        # Changed since.
+        response, body = self._download(HTTP_RANGE='bytes=2-4',
+                                        HTTP_IF_RANGE='"other"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.CONTENT)
+
+
+class UploadTest(TestCase):
+    """Uploaded files, kept once per content in the store."""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = os.path.join(self.dir, '.store')
+        self.saved = (views.FILES_STORE, views.FILES_INDEX)
+        views.FILES_STORE = self.store
+        views.FILES_INDEX = os.path.join(self.store, 'files.yml')
+
+    def tearDown(self):
+        views.FILES_STORE, views.FILES_INDEX = self.saved
+        shutil.rmtree(self.dir)
+
+    def _upload(self, attr_id, content, name='upload.txt'):
+        filename = os.path.join(self.dir, attr_id)
+        views._save_upload(SimpleUploadedFile(name, content), attr_id,
+                           filename)
+        return filename
+
+    def _stored(self):
+        return sorted(name for name in os.listdir(self.store)
+                      if name != 'files.yml')
+
+    def test_index(self):
+        filename = self._upload('f1', 'abc', name='a.txt')
+        with open(filename, 'rb') as fp:
+            self.assertEqual(fp.read(), 'abc')
+        info = yaml.load(views.FILES_INDEX)['f1']
+        self.assertEqual(info['size'], 3)
+        self.assertEqual(info['name'], 'a.txt')
+        self.assertEqual(self._stored(), [info['digest']])
+        self.assertTrue(os.path.samefile(
+            filename, os.path.join(self.store, info['digest'])))
+
+    def test_same_content(self):
+        f1 = self._upload('f1', 'abc')
+        f2 = self._upload('f2', 'abc')
+        # Both linked to the one stored copy.
+        self.assertEqual(len(self._stored()), 1)
+        self.assertTrue(os.path.samefile(f1, f2))
+        index = yaml.load(views.FILES_INDEX)
+        self.assertEqual(index['f1']['digest'], index['f2']['digest'])
+
+    def test_unchanged(self):
+        self._upload('f1', 'abc')
+        before = os.stat(views.FILES_INDEX).st_ino
+        self._upload('f1', 'abc')
+        # Not written again.
+        self.assertEqual(os.stat(views.FILES_INDEX).st_ino, before)
+
+    def test_replaced(self):
+        f1 = self._upload('f1', 'abc')
+        self._upload('f2', 'abc')
+        self._upload('f1', 'def')
+        with open(f1, 'rb') as fp:
+            self.assertEqual(fp.read(), 'def')
+        # The old content is still linked to by f2.
+        self.assertEqual(len(self._stored()), 2)
+        self._upload('f2', 'def')
+        # Now unused, so removed.
+        self.assertEqual(self._stored(),
+                         [yaml.load(views.FILES_INDEX)['f1']['digest']])
+
+
+class SaveGroupTest(TestCase):
+    """Saving the answers of one group."""
+
+    MENUS = [{
+        'Prepare': [{
+            'Container': [
+                {'Group1': [{'Section': [{'id': 'a', 'input': 'text'}]}]},
+                {'Group2': [{'Section': [
+                    {'id': 'b', 'input': 'text'},
+                    {'id': 'c', 'input': 'text'},
+                    {'id': 'd', 'input': 'text'},
+                ]}]},
+            ],
+        }],
+    }]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.settings = override_settings(
+            ANSWER_FILE_DIR=self.dir, ANSWER_FILE_BASE='base.yml',
+            ANSWER_FILE_DEFAULT='answers.yml',
+            INPUT_OPTIONS=os.path.join(self.dir, 'options.yml'),
+            PREPARE_MENU='Prepare')
+        self.settings.enable()
+        self.saved_status_file = views.STATUS_FILE
+        views.STATUS_FILE = os.path.join(self.dir, 'answers.yml.status')
+        self.filename = os.path.join(self.dir, 'answers.yml')
+        yaml.dump(os.path.join(self.dir, 'base.yml'), self.MENUS)
+        yaml.dump(self.filename, {
+            'a': 'old',
+            'b': ['x', 'y'],
+            'c': 1,
+            'd': u'caf\xe9',
+        })
+        self.factory = RequestFactory()
+
+    def tearDown(self):
+        views.STATUS_FILE = self.saved_status_file
+        self.settings.disable()
+        shutil.rmtree(self.dir)
 
-# Create your tests here.
+    def test_other_groups_unchanged(self):
+        before = yaml.load(self.filename)
+        errors = views.write_answer_file(self.factory.post('/'),
+                                         self.filename, {'a': 'new'},
+                                         'Container', 'Group1')
+        self.assertEqual(errors, [])
+        after = yaml.load(self.filename)
+        self.assertEqual(after['a'], 'new')
+        for attr_id in ('b', 'c', 'd'):
+            self.assertEqual(yaml.dumps(after[attr_id]),
+                             yaml.dumps(before[attr_id]), attr_id)
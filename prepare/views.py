@@ -13,18 +13,27 @@
 #  See the License for the specific language governing permissions and
 #  limitations under the License.
 #
+import contextlib
 import fcntl
+import hashlib
 import json
 import logging
 import mimetypes
 import os
+from copy import deepcopy
 
 from django.conf import settings
+from django.core.cache import get_cache
 from django.core.servers.basehttp import FileWrapper
-from django.http import HttpResponse
-from django.shortcuts import render
+from django.http import HttpResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.http import http_date
 
+from chaperone.decorators import revalidate
 from chaperone.utils import getters
+from chaperone.utils import metrics
+from chaperone.utils import store
 from chaperone.utils import yaml
 
 LOG = logging.getLogger(__name__)
@@ -32,6 +41,36 @@ LOG = logging.getLogger(__name__)
 # Input types that are not required to have a value set.
 OPTIONAL_INPUT_TYPES = ('checkbox', 'file')
 
+# Completion status of each group, along with the versions of the files it was
+# worked out from.
+STATUS_FILE = getattr(settings, 'ANSWER_FILE_STATUS',
+                      os.path.join(settings.ANSWER_FILE_DIR,
+                                   '%s.status' % settings.ANSWER_FILE_DEFAULT))
+
+# Cache, from CACHES, that rendered group forms are kept in.
+FORM_CACHE = getattr(settings, 'PREPARE_FORM_CACHE', 'default')
+# Stands in for the CSRF token in rendered group forms, until they are
+# returned for a request.
+CSRF_PLACEHOLDER = 'CSRFTOKENPLACEHOLDER'
+
+# Have the web server send downloaded files, with 'X-Sendfile' (Apache
+# mod_xsendfile, lighttpd) or 'X-Accel-Redirect' (nginx), or None to send
+# them from here.
+FILES_OFFLOAD = getattr(settings, 'PREPARE_FILES_OFFLOAD', None)
+# Internal nginx location serving PREPARE_FILES_DIR, for X-Accel-Redirect.
+FILES_ACCEL_PREFIX = getattr(settings, 'PREPARE_FILES_ACCEL_PREFIX',
+                             '/prepare-files/')
+# Bytes read at a time when sending files from here.
+DOWNLOAD_BLOCK_SIZE = 64 * 1024
+
+# Content of uploaded files, named by digest. Files in PREPARE_FILES_DIR are
+# links to it.
+FILES_STORE = getattr(settings, 'PREPARE_FILES_STORE',
+                      os.path.join(settings.PREPARE_FILES_DIR, '.store'))
+# Digest, size and uploaded name of each file in PREPARE_FILES_DIR, keyed by
+# attribute id.
+FILES_INDEX = os.path.join(FILES_STORE, 'files.yml')
+
 
 def _has_value(attribute):
     # Return True if attribute has its value set.
@@ -43,14 +82,61 @@ def _has_value(attribute):
         return value
 
 
-def _get_sections(container_name=None, group_name=None):
+class _SectionsContext(object):
+    # Inputs for populating sections, read once for a request, and the
+    # sections already populated from them. Only writing the answer file
+    # makes the request populate sections again.
+
+    def __init__(self):
+        base = os.path.join(settings.ANSWER_FILE_DIR,
+                            settings.ANSWER_FILE_BASE)
+        self.menus = yaml.load(base)
+        # Cache option values already retrieved in this request.
+        self.opt_cache = yaml.load(settings.INPUT_OPTIONS)
+        self._saved_answers = None
+        # Containers or sections keyed by (container name, group name).
+        self.sections = {}
+
+    @property
+    def saved_answers(self):
+        if self._saved_answers is None:
+            filename = os.path.join(settings.ANSWER_FILE_DIR,
+                                    settings.ANSWER_FILE_DEFAULT)
+            self._saved_answers = yaml.load(filename)
+        return self._saved_answers
+
+    def answers_written(self):
+        # Saved answers changed, so sections need populating again.
+        self._saved_answers = None
+        self.sections = {}
+
+
+def _get_context(request):
+    # Return the sections context for the request.
+    context = getattr(request, '_sections_context', None)
+    if context is None:
+        context = request._sections_context = _SectionsContext()
+    return context
+
+
+@metrics.timed('chaperone_prepare_sections_seconds')
+def _get_sections(container_name=None, group_name=None, context=None):
     # Return containers with all sections populated with the calculated
     # metadata for all attributes, or only the section for the given group in
-    # the given container.
-    #
+    # the given container. Sections already populated in the context are
+    # reused, and must not be changed.
+    if context is None:
+        context = _SectionsContext()
+    key = (container_name, group_name)
+    if key not in context.sections:
+        context.sections[key] = _populate_sections(context, container_name,
+                                                   group_name)
+    return context.sections[key]
+
+
+def _populate_sections(context, container_name=None, group_name=None):
     # See chaperone/local_settings.py.example for schema.
-    base = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
-    menus = yaml.load(base)
+    menus = deepcopy(context.menus)
     containers = []
     for menu in menus:
         for menu_name, menu_containers in menu.items():
@@ -58,13 +144,10 @@ def _get_sections(container_name=None, group_name=None):
                 containers = menu_containers
                 break
 
-    filename = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_DEFAULT)
-    saved_answers = yaml.load(filename)
+    saved_answers = context.saved_answers
     hidden_attributes = []
     shown_opt_attrs = []
-
-    # Cache option values already retrieved in this request.
-    opt_cache = yaml.load(settings.INPUT_OPTIONS)
+    opt_cache = context.opt_cache
 
     # [{ ... }]
     for container in containers:
@@ -134,6 +217,10 @@ def _get_form(attr, saved_answers, opt_cache, attr_id=None):
             settings.PREPARE_FILES_DIR, attr_id)
         if os.path.exists(current_filename):
             attr['current'] = '1';
+            file_info = yaml.load(FILES_INDEX).get(attr_id)
+            if file_info:
+                attr['current_size'] = file_info['size']
+                attr['current_digest'] = file_info['digest']
 
     attr_show = attr.get('show')
     if attr_show:
@@ -156,7 +243,7 @@ def _get_form(attr, saved_answers, opt_cache, attr_id=None):
             fn_name = 'get_%s' % field_name
             LOG.debug('Calling on %s to obtain options.' % fn_name)
             fn = getattr(getters, fn_name)
-            options = fn()
+            options = fn(caller='_get_form')
             if options:
                 opt_names = options.keys()
                 opt_names.sort()
@@ -214,7 +301,6 @@ def _get_form(attr, saved_answers, opt_cache, attr_id=None):
 
     return hidden_attributes, shown_opt_attrs, attr
 
-from copy import deepcopy
 def _get_multiform(attr, answers, opt_cache):
     subsection = []
     hidden_attributes = []
@@ -229,13 +315,15 @@ def _get_multiform(attr, answers, opt_cache):
             subsection.append(new_item)
     return hidden_attributes, shown_opt_attrs, subsection
 
-def _get_attributes_by_id(container_name=None, group_name=None):
+def _get_attributes_by_id(container_name=None, group_name=None,
+                          context=None):
     # Return all attribute metadata, keyed by attribute id, optionally for only
     # the given group in the given container.
     #
     # See chaperone/local_settings.py.example for schema.
     containers_or_sections = _get_sections(container_name=container_name,
-                                           group_name=group_name)
+                                           group_name=group_name,
+                                           context=context)
     if group_name:
         # Already got sections for the group.
         all_sections = containers_or_sections
@@ -263,9 +351,120 @@ def _get_attributes_by_id(container_name=None, group_name=None):
     return attributes_by_id
 
 
-def write_answer_file(request, filename, new_answers=None):
-    """Write out answer file, replacing old values with new ones, if given."""
+def _build_attribute_index(menus):
+    # Return where each attribute is in the schema, keyed by attribute id,
+    # and the ids of the attributes in each group, keyed by (container name,
+    # group name). Multiform items are listed under the ids they are saved
+    # with.
+    containers = []
+    for menu in menus:
+        for menu_name, menu_containers in menu.items():
+            if menu_name == settings.PREPARE_MENU:
+                containers = menu_containers
+                break
+
+    attributes = {}
+    groups = {}
+    # [{ ... }]
+    for container in containers:
+        # { 'Container': { ... } }
+        for cname, container_groups in container.items():
+            # [{ ... }]
+            for group in container_groups:
+                # { 'Group': [...] }
+                for gname, sections in group.items():
+                    group_ids = groups.setdefault((cname, gname), [])
+                    # [{ ... }]
+                    for section in sections:
+                        # { 'Section': [...] }
+                        for sname, section_attributes in section.items():
+                            # [{ ... }]
+                            for attr in section_attributes:
+                                items = [attr]
+                                input_type = attr.get('input')
+                                if (input_type and
+                                        input_type.lower() == 'multiform'):
+                                    for n in range(int(attr['min_items'])):
+                                        for item in deepcopy(attr['items']):
+                                            item['id'] = '%s_%d' % (
+                                                item['id'], n)
+                                            items.append(item)
+                                for item in items:
+                                    attributes[item['id']] = {
+                                        'container': cname,
+                                        'group': gname,
+                                        'section': sname,
+                                        'attribute': item,
+                                    }
+                                    group_ids.append(item['id'])
+    return {
+        'attributes': attributes,
+        'groups': groups,
+    }
+
+
+# Attribute index for the schema version it was built from.
+_attribute_index = {}
+
+
+def _get_attribute_index():
+    # Return the attribute index for the current schema, only building it
+    # again when the schema has changed.
+    base = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
+    version = yaml.version(base)
+    index = _attribute_index.get(version)
+    if index is None:
+        index = _build_attribute_index(yaml.load(base))
+        _attribute_index.clear()
+        _attribute_index[version] = index
+    return index
+
+
+def write_answer_file(request, filename, new_answers=None,
+                      container_name=None, group_name=None):
+    """Write out answer file, replacing old values with new ones, if given.
+
+    If a group is given, only attributes in that group are updated, and all
+    others keep their saved values. Saved group status is updated to match.
+    """
+    context = _get_context(request)
+    with _locked_status():
+        saved_status = yaml.load(STATUS_FILE)
+        versions = _get_status_versions()
+        errors, changed_ids = _write_answers(request, filename, new_answers,
+                                             container_name, group_name,
+                                             context)
+        if not errors:
+            _update_status(saved_status, versions, changed_ids, context)
+    return errors
+
+
+def _save_upload(src, attr_id, filename):
+    # Save the uploaded file to the store, linked to by filename, and note
+    # what it is.
+    files_index = yaml.load(FILES_INDEX)
+    previous = files_index.get(attr_id, {})
+    digest, size, changed = store.save(src.chunks(), FILES_STORE, filename,
+                                       previous.get('digest'))
+    if not changed and previous.get('digest') == digest:
+        LOG.debug('Upload for %s unchanged' % attr_id)
+        return
+    files_index[attr_id] = {
+        'digest': digest,
+        'size': size,
+        'name': src.name,
+    }
+    yaml.dump(FILES_INDEX, files_index, atomic=True)
+    LOG.info('Saved upload for %s, %d bytes, sha256 %s' %
+             (attr_id, size, digest))
+
+
+def _write_answers(request, filename, new_answers, container_name,
+                   group_name, context):
+    # Write out answer file, returning errors and the ids of attributes given
+    # new values.
     errors = []
+    changed_ids = []
     saved_answers = yaml.load(filename)
     if os.path.exists(filename):
         # Make a backup copy.
@@ -273,15 +472,47 @@ def write_answer_file(request, filename, new_answers=None):
         yaml.dump(backup_filename, saved_answers)
         LOG.debug('Backup file %s written' % backup_filename)
 
-    attributes_by_id = _get_attributes_by_id()
+    answers_data = {}
+    index = _get_attribute_index()
+    group_ids = index['groups'].get((container_name, group_name))
+    if (group_ids is not None and
+            all(attr_id in saved_answers for attr_id in index['attributes'])):
+        # Only attributes in the group can change, apart from those with
+        # dynamic options, as saved values may no longer be among them.
+        group_ids = set(group_ids)
+        dynamic_ids = {}
+        for attr_id, entry in index['attributes'].items():
+            if attr_id in group_ids:
+                continue
+            if isinstance(entry['attribute'].get('options', []), list):
+                answers_data[attr_id] = saved_answers[attr_id]
+            else:
+                dynamic_ids.setdefault(
+                    (entry['container'], entry['group']), []).append(attr_id)
+        attributes_by_id = _get_attributes_by_id(container_name=container_name,
+                                                 group_name=group_name,
+                                                 context=context)
+        for (cname, gname), attr_ids in dynamic_ids.items():
+            group_attributes = _get_attributes_by_id(container_name=cname,
+                                                     group_name=gname,
+                                                     context=context)
+            for attr_id in attr_ids:
+                if attr_id in group_attributes:
+                    # Checked against the current options.
+                    attributes_by_id[attr_id] = group_attributes[attr_id]
+                else:
+                    answers_data[attr_id] = saved_answers[attr_id]
+    else:
+        # Need current or default values for everything.
+        attributes_by_id = _get_attributes_by_id(context=context)
     if not new_answers:
         new_answers = request.REQUEST
 
-    answers_data = {}
     for attr_id, attr in attributes_by_id.items():
         if new_answers and attr_id in new_answers:
             # Set new value.
             value = new_answers[attr_id]
+            changed_ids.append(attr_id)
             LOG.debug('Saving new value %s: %s' % (attr_id, value))
 
             # Check if there is a new file to save.
@@ -289,13 +520,11 @@ def write_answer_file(request, filename, new_answers=None):
                 src = request.FILES.get('file-%s' % attr_id)
                 dst_filename = os.path.join(settings.PREPARE_FILES_DIR, attr_id)
                 if src:
-                    with open(dst_filename, 'wb+') as dp:
-                        for chunk in src.chunks():
-                            dp.write(chunk)
+                    _save_upload(src, attr_id, dst_filename)
                 elif not os.path.exists(dst_filename):
                     # Should have a previously uploaded file available.
                     errors.append('File missing for %s.' % attr_id)
-                    return errors
+                    return errors, changed_ids
         else:
             # Use currently saved value.
             value = attr.get('value', '')
@@ -304,27 +533,70 @@ def write_answer_file(request, filename, new_answers=None):
 
     LOG.debug('Dumping values: %s' % str(answers_data))
     yaml.dump(filename, answers_data)
+    context.answers_written()
     LOG.info('File %s written' % filename)
-    return errors
+    return errors, changed_ids
+
+
+def _get_form_key(container_name, group_name):
+    # Return cache key for the group's rendered form, which changes whenever
+    # anything it was rendered from does.
+    versions = _get_status_versions()
+    try:
+        # Notes files being uploaded.
+        files_version = os.path.getmtime(settings.PREPARE_FILES_DIR)
+    except OSError:
+        files_version = None
+    key = repr((unicode(container_name), unicode(group_name),
+                versions['schema'], versions['answers'], versions['options'],
+                files_version))
+    return 'prepare-form-%s' % hashlib.sha1(key).hexdigest()
+
+
+def _render_group(request):
+    # Return form to set answers for the sections in the requested group.
+    container_name = request.REQUEST.get('cname')
+    group_name = request.REQUEST.get('gname')
+    form_cache = get_cache(FORM_CACHE)
+    key = _get_form_key(container_name, group_name)
+    content = form_cache.get(key)
+    if content is None:
+        sections = _get_sections(container_name=container_name,
+                                 group_name=group_name,
+                                 context=_get_context(request))
+        # Rendered without the request, so it can be used for any request.
+        with metrics.timer('chaperone_template_render_seconds',
+                           template='prepare/_group.html'):
+            content = render_to_string('prepare/_group.html', {
+                'menu_name': settings.PREPARE_MENU,
+                'container_name': container_name,
+                'group_name': group_name,
+                'sections': sections,
+                'csrf_token': CSRF_PLACEHOLDER,
+            })
+        form_cache.set(key, content)
+    else:
+        LOG.debug('Using cached form for %s %s' % (container_name, group_name))
+    return content.replace(CSRF_PLACEHOLDER, get_token(request) or '')
+
 
+def _get_group_etag(request):
+    # The form changes along with what it is rendered from, and the CSRF
+    # token put in it.
+    key = _get_form_key(request.REQUEST.get('cname'),
+                        request.REQUEST.get('gname'))
+    return hashlib.sha1('%s %s' % (key, get_token(request) or '')).hexdigest()
 
+
+@revalidate(_get_group_etag)
 def get_group(request):
     """Display form to set answers for the sections in this group."""
-    container_name = request.REQUEST.get('cname')
-    group_name = request.REQUEST.get('gname')
-    sections = _get_sections(container_name=container_name,
-                             group_name=group_name)
+    return HttpResponse(_render_group(request))
 
-    return render(request, 'prepare/_group.html', {
-        'menu_name': settings.PREPARE_MENU,
-        'container_name': container_name,
-        'group_name': group_name,
-        'sections': sections,
-    })
 
-
-def _is_group_complete(sections):
-    # Return True if group has all required values set in its sections.
+def _get_missing_attributes(sections):
+    # Return ids of required attributes with no value set in the sections.
+    missing = []
     for section in sections:
         # { 'Section': [...] }
         for attributes in section.values():
@@ -334,69 +606,260 @@ def _is_group_complete(sections):
                         not attr.get('optional') and not attr.get('hide') and
                         not _has_value(attr)):
                     LOG.debug('%s missing' % attr['id'])
-                    return False
-    return True
+                    missing.append(attr['id'])
+    return missing
 
 
+def _summarize_group(sections):
+    # Return status of a group with the given sections.
+    missing = _get_missing_attributes(sections)
+    return {
+        'complete': not missing,
+        'missing': missing,
+    }
+
+
+def _get_status_versions():
+    # Return versions of the files that group status is worked out from.
+    base = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_BASE)
+    answers = os.path.join(settings.ANSWER_FILE_DIR,
+                           settings.ANSWER_FILE_DEFAULT)
+    return {
+        'schema': yaml.version(base),
+        'answers': yaml.version(answers),
+        'options': yaml.version(settings.INPUT_OPTIONS),
+    }
+
+
+@contextlib.contextmanager
+def _locked_status():
+    # Keep other requests, in any process, from changing answers or group
+    # status until done.
+    with open('%s.lock' % STATUS_FILE, 'a') as fp:
+        fcntl.flock(fp, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fp, fcntl.LOCK_UN)
+
+
+def _build_status(context=None):
+    # Return status of every group, keyed by container and group name.
+    status = {}
+    # [{ ... }]
+    for container in _get_sections(context=context):
+        # { 'Container': { ... } }
+        for cname, groups in container.items():
+            status[cname] = {}
+            # [{ ... }]
+            for group in groups:
+                # { 'Group': [...] }
+                for gname, sections in group.items():
+                    status[cname][gname] = _summarize_group(sections)
+    return status
+
+
+def _save_status(status):
+    yaml.dump(STATUS_FILE, {
+        'versions': _get_status_versions(),
+        'groups': status,
+    }, atomic=True)
+    LOG.debug('Group status saved to %s' % STATUS_FILE)
+
+
+def _update_status(saved_status, versions, changed_ids, context=None):
+    # Save group status after new values for the given attribute ids were
+    # written, given the status saved and versions of its files from before.
+    # Only groups with new values, and those with dynamic options if the
+    # options changed, are worked out again.
+    status = saved_status.get('groups')
+    saved_versions = saved_status.get('versions', {})
+    if (status is None or
+            saved_versions.get('schema') != versions['schema'] or
+            saved_versions.get('answers') != versions['answers']):
+        # Not known how the saved status relates to the new answers.
+        _save_status(_build_status(context))
+        return
+
+    index = _get_attribute_index()
+    changed_groups = set()
+    for attr_id in changed_ids:
+        entry = index['attributes'].get(attr_id)
+        if entry:
+            changed_groups.add((entry['container'], entry['group']))
+    if saved_versions.get('options') != versions['options']:
+        for entry in index['attributes'].values():
+            if not isinstance(entry['attribute'].get('options', []), list):
+                changed_groups.add((entry['container'], entry['group']))
+
+    for cname, gname in changed_groups:
+        LOG.debug('Updating status of %s %s' % (cname, gname))
+        sections = _get_sections(container_name=cname, group_name=gname,
+                                 context=context)
+        status.setdefault(cname, {})[gname] = _summarize_group(sections)
+    _save_status(status)
+
+
+def _get_status():
+    # Return saved group status, only working it out again if its files were
+    # changed some other way than by writing the answer file here.
+    saved_status = yaml.load(STATUS_FILE)
+    if (saved_status.get('groups') is not None and
+            saved_status.get('versions') == _get_status_versions()):
+        return saved_status['groups']
+
+    with _locked_status():
+        status = _build_status()
+        _save_status(status)
+    return status
+
+
+def _get_status_etag(request):
+    # Group status changes along with the files it is worked out from.
+    versions = _get_status_versions()
+    return hashlib.sha1(repr((
+        request.REQUEST.get('cname'), request.REQUEST.get('gname'),
+        sorted(versions.items())))).hexdigest()
+
+
+@revalidate(_get_status_etag)
 def get_group_status(request):
     """Get current state of group, or all groups, if group name not given."""
     container_name = request.REQUEST.get('cname')
     group_name = request.REQUEST.get('gname')
-    containers_or_sections = _get_sections(container_name=container_name,
-                                           group_name=group_name)
-    data = {}
+    status = _get_status()
 
     if group_name:
         # Only dealing with one group.
-        is_complete = _is_group_complete(containers_or_sections)
-        data[container_name][group_name] = { 'complete': is_complete }
+        group_status = status.get(container_name, {}).get(group_name)
+        data = {container_name: {group_name: group_status}}
     else:
-        # [{ ... }]
-        for container in containers_or_sections:
-            # { 'Container': { ... } }
-            for cname, groups in container.items():
-                data[cname] = {}
-                # [{ ... }]
-                for group in groups:
-                    # { 'Group': [...] }
-                    for gname, sections in group.items():
-                        is_complete = _is_group_complete(sections)
-                        data[cname][gname] = { 'complete': is_complete }
-    # Return status for all groups.
+        # Return status for all groups.
+        data = status
     return HttpResponse(json.dumps(data), content_type='application/json')
 
 
 def save_group(request):
     """Save new answers for the group."""
+    container_name = request.REQUEST.get('cname')
+    group_name = request.REQUEST.get('gname')
     filename = os.path.join(settings.ANSWER_FILE_DIR, settings.ANSWER_FILE_DEFAULT)
-    errors = write_answer_file(request, filename)
+    errors = write_answer_file(request, filename,
+                               container_name=container_name,
+                               group_name=group_name)
     # Get updated values, e.g., current versions of files.
-    group = get_group(request).content
+    group = _render_group(request)
     data = {
         'errors': errors,
         'group': group,
     }
 
     if not errors:
-        container_name = request.REQUEST.get('cname')
-        group_name = request.REQUEST.get('gname')
-        sections = _get_sections(container_name=container_name,
-                                 group_name=group_name)
-        data['complete'] = _is_group_complete(sections)
+        group_status = _get_status().get(container_name, {}).get(group_name)
+        if group_status:
+            data['complete'] = group_status['complete']
+            data['missing'] = group_status['missing']
     return HttpResponse(json.dumps(data), content_type='application/json')
 
 
+def _get_range(request, size, etag, last_modified):
+    # Return (first byte, last byte) of the single byte range asked for, None
+    # to send the whole file, or False if the range is past the end of it.
+    header = request.META.get('HTTP_RANGE', '')
+    if not header.startswith('bytes='):
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range not in (etag, last_modified):
+        # File changed since the client got the start of it.
+        return None
+    ranges = header[len('bytes='):].split(',')
+    if len(ranges) != 1:
+        # Sending several ranges is not worth it.
+        return None
+    first, sep, last = ranges[0].strip().partition('-')
+    try:
+        if not first:
+            # Last bytes of the file.
+            length = int(last)
+            if length <= 0 or not size:
+                return False
+            return max(size - length, 0), size - 1
+        first = int(first)
+        last = int(last) if last else None
+    except ValueError:
+        return None
+    if last is not None and first > last:
+        return None
+    if first >= size:
+        return False
+    if last is None or last >= size:
+        last = size - 1
+    return first, last
+
+
+def _read_range(fp, first, length):
+    # Yield the given number of bytes from the file, starting at first.
+    try:
+        fp.seek(first)
+        while length > 0:
+            data = fp.read(min(DOWNLOAD_BLOCK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        fp.close()
+
+
 def download_file(request, name):
     """Retrieve file for user download."""
     # Prevent directory traversal.
     basename = os.path.basename(name)
     filename = '%s/%s' % (settings.PREPARE_FILES_DIR, basename)
 
+    if FILES_OFFLOAD:
+        # Web server sends the file, and handles any range asked for.
+        response = HttpResponse(content_type='text/plain')
+        if FILES_OFFLOAD.lower() == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = '%s%s' % (FILES_ACCEL_PREFIX,
+                                                     basename)
+        else:
+            response['X-Sendfile'] = os.path.abspath(filename)
+        response['Content-Disposition'] = "attachment; filename=%s" % basename
+        return response
+
+    fp = open(filename, 'rb')
+    st = os.fstat(fp.fileno())
+    size = st.st_size
+    etag = '"%x-%x"' % (int(st.st_mtime * 1000000), size)
+    last_modified = http_date(st.st_mtime)
+    byte_range = _get_range(request, size, etag, last_modified)
+
+    if byte_range is False:
+        fp.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+
     # Loading file in chunks, in case it's large. Returning it as MIME type
     # text/plain causes Chrome to guess what file extension to add to the
     # filename during the download.
-    response = HttpResponse(FileWrapper(open(filename)),
-                            content_type='text/plain')
-    response['Content-Length'] = os.path.getsize(filename)
+    if byte_range:
+        first, last = byte_range
+        response = StreamingHttpResponse(
+            _read_range(fp, first, last - first + 1),
+            status=206, content_type='text/plain')
+        response['Content-Range'] = 'bytes %d-%d/%d' % (first, last, size)
+        response['Content-Length'] = last - first + 1
+    else:
+        response = StreamingHttpResponse(
+            FileWrapper(fp, DOWNLOAD_BLOCK_SIZE), content_type='text/plain')
+        response['Content-Length'] = size
+        # The WSGI application has the server send this file itself, if it
+        # can, e.g., with sendfile().
+        response.file_to_stream = fp
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
     response['Content-Disposition'] = "attachment; filename=%s" % basename
     return response